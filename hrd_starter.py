@@ -1,8 +1,22 @@
-from copy import deepcopy
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from heapq import heappush, heappop
 import time
 import argparse
+import glob
+import json
+import mmap
+import os
+import resource
+import signal
+import sqlite3
+import struct
 import sys
+import threading
 
 # ====================================================================================
 
@@ -15,6 +29,8 @@ class Piece:
     This represents a piece on the Hua Rong Dao puzzle.
     """
 
+    __slots__ = ('is_goal', 'is_single', 'coord_x', 'coord_y', 'orientation')
+
     def __init__(self, is_goal, is_single, coord_x, coord_y, orientation):
         """
         :param is_goal: True if the piece is the goal piece and False otherwise.
@@ -46,14 +62,18 @@ class Board:
     Board class for setting up the playing board.
     """
 
-    def __init__(self, pieces):
+    def __init__(self, pieces, geometry=None):
         """
         :param pieces: The list of Pieces
         :type pieces: List[Piece]
+        :param geometry: The size and goal of the board, or None for the
+            classic 5x4 board.
+        :type geometry: Optional[Geometry]
         """
 
-        self.width = 4
-        self.height = 5
+        self.geometry = classic if geometry is None else geometry
+        self.width = self.geometry.width
+        self.height = self.geometry.height
 
         self.pieces = pieces
 
@@ -101,6 +121,14 @@ class Board:
                 print(ch, end='')
             print()
 
+    def __eq__(self, other):
+        if not isinstance(other, Board):
+            return NotImplemented
+        return encode_grid(self.grid) == encode_grid(other.grid)
+
+    def __hash__(self):
+        return hash(encode_grid(self.grid))
+
 
 class State:
     """
@@ -110,6 +138,8 @@ class State:
     heuristic function, f value, current depth and parent.
     """
 
+    __slots__ = ('board', 'f', 'depth', 'parent', 'id')
+
     def __init__(self, board, f, depth, parent=None):
         """
         :param board: The board of the state.
@@ -125,7 +155,7 @@ class State:
         self.f = f
         self.depth = depth
         self.parent = parent
-        self.id = hash(board)  # The id for breaking ties.
+        self.id = hash(board)  # Hash of the encoded board; astar breaks ties in HeapOpenList.
     """
     # overload operator to compare class based on their heuristic value
     def __lt__(self, other):
@@ -136,23 +166,80 @@ class State:
     """
 
 
-def read_from_file(filename):
+class InvalidBoard(ValueError):
+    """
+    Raised when the rows of a puzzle do not describe a valid board.
+    """
+
+
+def _puzzle_row(line):
+    """
+    :param line: A line of a puzzle file.
+    :type line: str
+    :return: The cells of the row, without the line ending, surrounding
+        blanks and the brackets and commas of the [[^^^^], ...] layout.
+    :rtype: str
+    """
+    return line.strip(' \t\r\n[],')
+
+
+def read_from_file(filename, goal=None):
     """
     Load initial board from a given file.
 
     :param filename: The name of the given file.
     :type filename: str
+    :param goal: The (row, col) the top-left cell of the 2x2 piece has to
+        reach, or None for the middle of the two bottom rows.
+    :type goal: Optional[Tuple[int, int]]
     :return: A loaded board
     :rtype: Board
     """
 
     puzzle_file = open(filename, "r")
+    board = read_from_lines(puzzle_file, goal)
+    puzzle_file.close()
+
+    return board
+
+
+def read_from_lines(lines, goal=None):
+    """
+    Load initial board from the lines of a puzzle. The size of the board is
+    taken from the lines. The board is rebuilt from the pieces found and
+    compared with the lines, so a malformed puzzle is rejected rather than
+    silently changed.
+
+    :param lines: The rows of the puzzle, top to bottom.
+    :type lines: Iterable[str]
+    :param goal: The (row, col) the top-left cell of the 2x2 piece has to
+        reach, or None for the middle of the two bottom rows.
+    :type goal: Optional[Tuple[int, int]]
+    :return: A loaded board
+    :rtype: Board
+    :raises InvalidBoard: If the lines are not a rectangular board of whole
+        pieces with exactly one 2x2 piece, or the goal does not fit it.
+    """
+
+    rows = [_puzzle_row(line) for line in lines]
+    while rows and not rows[-1]:
+        rows.pop()
+    if not rows:
+        raise InvalidBoard('board has no rows')
+    for row_number, row in enumerate(rows, 1):
+        if len(row) != len(rows[0]):
+            raise InvalidBoard('row {} has {} cells, expected {}'.format(
+                row_number, len(row), len(rows[0])))
+    try:
+        geometry = get_geometry(len(rows[0]), len(rows), goal)
+    except ValueError as error:
+        raise InvalidBoard(str(error)) from None
 
     line_index = 0
     pieces = []
     g_found = False
 
-    for line in puzzle_file:
+    for line in rows:
 
         for x, ch in enumerate(line):
 
@@ -168,533 +255,3454 @@ def read_from_file(filename):
                     g_found = True
         line_index += 1
 
-    puzzle_file.close()
-
-    board = Board(pieces)
+    if not g_found:
+        raise InvalidBoard('board has no 2x2 piece')
+    try:
+        board = Board(pieces, geometry)
+    except IndexError:
+        raise InvalidBoard('a piece sticks out of the board') from None
+    for row_number, (row, line) in enumerate(zip(rows, board.grid), 1):
+        for column, (ch, expected) in enumerate(zip(row, line), 1):
+            if ch != expected:
+                raise InvalidBoard('row {}, column {}: {!r} does not fit the pieces around it, '
+                                   'expected {!r}'.format(row_number, column, ch, expected))
+    area = sum(4 if piece.is_goal else 1 if piece.is_single else 2 for piece in pieces)
+    if area != sum(ch != '.' for row in rows for ch in row):
+        raise InvalidBoard('pieces overlap')
 
     return board
 
 
-board_visited_set = set()
-board_visited = []
-
-
-def dfs(initial_state):
-    # a list that contains all the visited board and if encounter the same situation, discard the one has more depth
-
-    # the frontier queue used by the dfs (stack)
-    # first_state = State(game_board, 0, 0, None)
-    # board_visited.append(first_state)
-    stack = [initial_state]
-
-    while len(stack):
-        next_state = stack.pop()
-        # next_state.board.display()
-
-        if str(next_state.board.grid) not in board_visited_set:
-            board_visited_set.add(str(next_state.board.grid))
-        game_board = next_state.board
-        board_grid = next_state.board.grid
-        # find the coordinate of two white space of two white space
-        if board_grid[3][1] == char_goal and board_grid[3][2] == char_goal \
-                and board_grid[4][1] == char_goal and board_grid[4][2] == char_goal:
-            return next_state
-        """
-        coordinate_space = []
-        for x in range(0, 4):
-            for y in range(0, 5):
-                if board_grid[x][y] is '.':
-                    coordinate_space.append([x, y])
-        white_space1 = coordinate_space[0]
-        """
-        for x in range(0, 5):
-            for y in range(0, 4):
-                if board_grid[x][y] == '^':
-                    # move to the left for 2x1 (vertical)
-                    if y != 0:
-                        if board_grid[x][y - 1] == '.' and board_grid[x + 1][y - 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x + 1][y] = '.'
-                            game_board_copy.grid[x][y - 1] = '^'
-                            game_board_copy.grid[x + 1][y - 1] = 'v'
-
-                            # check duplicate
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                    # move to the right for 2x1 (vertical)
-                    if y != 3:
-                        if board_grid[x][y + 1] == '.' and board_grid[x + 1][y + 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x + 1][y] = '.'
-                            game_board_copy.grid[x][y + 1] = '^'
-                            game_board_copy.grid[x + 1][y + 1] = 'v'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                    # move to the top for 2x1 (vertical)
-                    if x != 0:
-                        if board_grid[x - 1][y] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = 'v'
-                            game_board_copy.grid[x - 1][y] = '^'
-                            game_board_copy.grid[x + 1][y] = '.'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                    # move down the 2x1 (vertical)
-                    if x < 3:
-                        if board_grid[x + 2][y] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x + 1][y] = '^'
-                            game_board_copy.grid[x + 2][y] = 'v'
-                            # form a new state and add it into the stack for future search
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                # if the grid is a single 1x1
-                elif board_grid[x][y] == char_single:
-                    if x != 4:
-                        if board_grid[x + 1][y] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x + 1][y] = char_single
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                    if x != 0:
-                        if board_grid[x - 1][y] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x - 1][y] = char_single
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                    if y != 3:
-                        if board_grid[x][y + 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x][y + 1] = char_single
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                    if y != 0:
-                        if board_grid[x][y - 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x][y - 1] = char_single
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                elif board_grid[x][y] == '<':
-                    # move the 1x2 to the left
-                    if y != 0:
-                        if board_grid[x][y - 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '>'
-                            game_board_copy.grid[x][y + 1] = '.'
-                            game_board_copy.grid[x][y - 1] = '<'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                    if y < 2:
-                        if board_grid[x][y + 2] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x][y + 1] = '<'
-                            game_board_copy.grid[x][y + 2] = '>'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                    if x != 0:
-                        if board_grid[x - 1][y] == '.' and board_grid[x - 1][y + 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x][y + 1] = '.'
-                            game_board_copy.grid[x - 1][y] = '<'
-                            game_board_copy.grid[x - 1][y + 1] = '>'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                    if x != 4:
-                        if board_grid[x + 1][y] == '.' and board_grid[x + 1][y + 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x][y + 1] = '.'
-                            game_board_copy.grid[x + 1][y] = '<'
-                            game_board_copy.grid[x + 1][y + 1] = '>'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                stack.append(new_state)
-                # The grid is the top left corner of the 2x2
-                elif x < 4 and y < 3:
-                    if board_grid[x][y] == char_goal \
-                            and board_grid[x + 1][y] == char_goal \
-                            and board_grid[x][y + 1] == char_goal:
-                        # move to the left
-                        if y != 0:
-                            if board_grid[x][y - 1] == '.' and board_grid[x + 1][y - 1] == '.':
-                                game_board_copy = deepcopy(game_board)
-                                game_board_copy.grid[x][y - 1] = char_goal
-                                game_board_copy.grid[x + 1][y - 1] = char_goal
-                                game_board_copy.grid[x][y + 1] = '.'
-                                game_board_copy.grid[x + 1][y + 1] = '.'
-                                if str(game_board_copy.grid) not in board_visited_set:
-                                    board_visited_set.add(str(game_board_copy.grid))
-                                    new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                    stack.append(new_state)
-                        # move to the right
-                        if y < 2:
-                            if board_grid[x][y + 2] == '.' and board_grid[x + 1][y + 2] == '.':
-                                game_board_copy = deepcopy(game_board)
-                                game_board_copy.grid[x][y] = '.'
-                                game_board_copy.grid[x + 1][y] = '.'
-                                game_board_copy.grid[x][y + 2] = char_goal
-                                game_board_copy.grid[x + 1][y + 2] = char_goal
-                                if str(game_board_copy.grid) not in board_visited_set:
-                                    board_visited_set.add(str(game_board_copy.grid))
-                                    new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                    stack.append(new_state)
-                        # move to the top
-                        if x != 0:
-                            if board_grid[x - 1][y] == '.' and board_grid[x - 1][y + 1] == '.':
-                                game_board_copy = deepcopy(game_board)
-                                game_board_copy.grid[x - 1][y] = char_goal
-                                game_board_copy.grid[x - 1][y + 1] = char_goal
-                                game_board_copy.grid[x + 1][y] = '.'
-                                game_board_copy.grid[x + 1][y + 1] = '.'
-                                if str(game_board_copy.grid) not in board_visited_set:
-                                    board_visited_set.add(str(game_board_copy.grid))
-                                    new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                    stack.append(new_state)
-                        # move down the grid
-                        if x < 3:
-                            if board_grid[x + 2][y] == '.' and board_grid[x + 2][y + 1] == '.':
-                                game_board_copy = deepcopy(game_board)
-                                game_board_copy.grid[x][y] = '.'
-                                game_board_copy.grid[x][y + 1] = '.'
-                                game_board_copy.grid[x + 2][y] = char_goal
-                                game_board_copy.grid[x + 2][y + 1] = char_goal
-                                if str(game_board_copy.grid) not in board_visited_set:
-                                    board_visited_set.add(str(game_board_copy.grid))
-                                    new_state = State(game_board_copy, 0, next_state.depth + 1, next_state)
-                                    stack.append(new_state)
+# ====================================================================================
+# Compact board encoding.
+#
+# A board is packed into a single int with 3 bits per cell, cell (row, col) living
+# at bit 3 * (row * width + col). Pieces of the same kind are interchangeable, so the
+# encoding is canonical: two boards are equal exactly when their codes are equal.
+# The top-left cell of the goal piece gets its own code so that the piece can be
+# located without looking at the neighbouring cells.
+
+CELL_EMPTY = 0
+CELL_GOAL = 1  # top-left cell of the 2x2 piece
+CELL_SINGLE = 2
+CELL_UP = 3  # '^'
+CELL_DOWN = 4  # 'v'
+CELL_LEFT = 5  # '<'
+CELL_RIGHT = 6  # '>'
+CELL_GOAL_BODY = 7  # the other three cells of the 2x2 piece
+
+cell_chars = '.' + char_goal + char_single + '^v<>' + char_goal
+
+# Grid characters to octal digits, so that a whole board encodes with one int().
+_encode_table = str.maketrans({'.': '0', char_goal: '7', char_single: '2',
+                               '^': '3', 'v': '4', '<': '5', '>': '6'})
+
+
+def encode_grid(grid):
+    """
+    Encode a grid of characters into the compact board representation.
+
+    :param grid: The grid of a board, or any iterable of its rows.
+    :type grid: List[List[str]]
+    :return: The encoded board.
+    :rtype: int
+    """
+    flat = ''.join(''.join(line) for line in grid)
+    code = int(flat[::-1].translate(_encode_table), 8)
+    head = flat.find(char_goal)
+    if head >= 0:
+        code ^= (CELL_GOAL ^ CELL_GOAL_BODY) << (3 * head)
+    return code
+
+
+def encode_board(board):
+    """
+    Encode a board into the compact board representation.
+
+    :param board: The board to encode.
+    :type board: Board
+    :return: The encoded board.
+    :rtype: int
+    """
+    return encode_grid(board.grid)
+
+
+def decode_board(code, geometry=None):
+    """
+    Rebuild a Board from its compact encoding.
+
+    :param code: The encoded board.
+    :type code: int
+    :param geometry: The size and goal of the board, or None for the
+        classic 5x4 board.
+    :type geometry: Optional[Geometry]
+    :return: The decoded board.
+    :rtype: Board
+    """
+    if geometry is None:
+        geometry = classic
+    pieces = []
+    for cell in range(geometry.cells):
+        value = (code >> (3 * cell)) & 7
+        coord_y, coord_x = divmod(cell, geometry.width)
+        if value == CELL_GOAL:
+            pieces.append(Piece(True, False, coord_x, coord_y, None))
+        elif value == CELL_SINGLE:
+            pieces.append(Piece(False, True, coord_x, coord_y, None))
+        elif value == CELL_UP:
+            pieces.append(Piece(False, False, coord_x, coord_y, 'v'))
+        elif value == CELL_LEFT:
+            pieces.append(Piece(False, False, coord_x, coord_y, 'h'))
+    return Board(pieces, geometry)
+
+
+# ====================================================================================
+# Move generation.
+#
+# Every piece is described by the cells it covers relative to its top-left cell,
+# together with the code stored in each of them. Moving a piece only ever empties
+# cells of that piece and fills cells that were empty, so the child board is the
+# parent code XOR the old and the new cell patterns of the piece. Those XOR deltas
+# and the cells that must be empty only depend on the board size, so they are
+# computed once for every (anchor cell, piece, direction) of a Geometry and the
+# move generator only does a mask test per candidate move. Taking a move back is
+# the same XOR, and the code doubles as an exact hash key kept up to date by it.
+#
+# Every move fills at least one empty cell, so blank_successors only looks at the
+# pieces next to the few empty cells rather than at every cell of the board. It
+# finds the same moves as successors in another order; dfs, whose path depends on
+# that order, keeps to successors.
+
+piece_shapes = {
+    CELL_GOAL: ((0, 0, CELL_GOAL), (0, 1, CELL_GOAL_BODY),
+                (1, 0, CELL_GOAL_BODY), (1, 1, CELL_GOAL_BODY)),
+    CELL_SINGLE: ((0, 0, CELL_SINGLE),),
+    CELL_UP: ((0, 0, CELL_UP), (1, 0, CELL_DOWN)),
+    CELL_LEFT: ((0, 0, CELL_LEFT), (0, 1, CELL_RIGHT)),
+}
+
+directions = {'up': (-1, 0), 'down': (1, 0), 'left': (0, -1), 'right': (0, 1)}
+
+
+def _build_move_table(width=4, height=5):
+    """
+    Precompute, for every anchor cell and every cell code, the moves a piece
+    anchored there could make on an empty board.
+
+    Each move is (empty mask, delta, anchor cell, direction): the move is legal
+    when all cells under the empty mask are empty, and the child board is then
+    the parent code XOR delta.
+
+    :param width: The number of columns of the board.
+    :type width: int
+    :param height: The number of rows of the board.
+    :type height: int
+    :return: move_table[cell][value] is the list of candidate moves.
+    :rtype: List[Tuple[List[Tuple[int, int, int, str]], ...]]
+    """
+    table = []
+    for cell in range(width * height):
+        row, col = divmod(cell, width)
+        by_value = [[] for _ in range(8)]
+        for value, shape in piece_shapes.items():
+            occupied = {(row + dr, col + dc) for dr, dc, _ in shape}
+            if not all(0 <= r < height and 0 <= c < width for r, c in occupied):
+                continue
+            old_pattern = 0
+            for dr, dc, part in shape:
+                old_pattern |= part << (3 * ((row + dr) * width + col + dc))
+            for direction, (move_r, move_c) in directions.items():
+                new_pattern = 0
+                empty_mask = 0
+                for dr, dc, part in shape:
+                    r, c = row + dr + move_r, col + dc + move_c
+                    if not (0 <= r < height and 0 <= c < width):
+                        break
+                    shift = 3 * (r * width + c)
+                    if (r, c) not in occupied:
+                        empty_mask |= 7 << shift
+                    new_pattern |= part << shift
+                else:
+                    by_value[value].append((empty_mask, old_pattern ^ new_pattern, cell, direction))
+        table.append(tuple(by_value))
+    return table
+
+
+def _make_successors(move_table):
+    """
+    :param move_table: A table built by _build_move_table.
+    :type move_table: List[Tuple[List[Tuple[int, int, int, str]], ...]]
+    :return: The move generator over that table.
+    :rtype: Callable[[int], Iterator[Tuple[int, int, str]]]
+    """
+    def successors(code):
+        """
+        Generate every board reachable from an encoded board with one move.
+        Only ints are produced, so callers decide which children are worth
+        turning back into a Board.
+
+        :param code: The encoded board.
+        :type code: int
+        :return: Triples of (child code, cell of the moved piece, direction).
+        :rtype: Iterator[Tuple[int, int, str]]
+        """
+        rest = code
+        for cell_moves in move_table:
+            if not rest:
+                # every remaining cell is empty
+                break
+            for empty_mask, delta, cell, direction in cell_moves[rest & 7]:
+                if not code & empty_mask:
+                    yield code ^ delta, cell, direction
+            rest >>= 3
+    return successors
+
+
+def _make_blank_successors(move_table):
+    """
+    :param move_table: A table built by _build_move_table.
+    :type move_table: List[Tuple[List[Tuple[int, int, int, str]], ...]]
+    :return: The move generator over that table driven by the empty cells.
+    :rtype: Callable[[int], Iterator[Tuple[int, int, str]]]
+    """
+    cells = len(move_table)
+    low_bits = sum(1 << (3 * cell) for cell in range(cells))
+    # empty cell -> (shift of an anchor cell, its moves by cell value) for the moves
+    # whose lowest cell to be emptied is that cell, so each move is found once
+    by_anchor = [{} for _ in range(cells)]
+    for cell_moves in move_table:
+        for value, moves in enumerate(cell_moves):
+            for move in moves:
+                empty_mask, delta, cell, direction = move
+                lowest = (empty_mask & -empty_mask).bit_length() // 3
+                anchor_moves = by_anchor[lowest].setdefault(3 * cell, [[] for _ in range(8)])
+                anchor_moves[value].append(move)
+    by_blank = [[(shift, tuple(anchor_moves)) for shift, anchor_moves in sorted(anchors.items())]
+                for anchors in by_anchor]
+
+    def blank_successors(code):
+        """
+        Generate every board reachable from an encoded board with one move,
+        looking only at the pieces next to its empty cells.
+
+        :param code: The encoded board.
+        :type code: int
+        :return: Triples of (child code, cell of the moved piece, direction).
+        :rtype: Iterator[Tuple[int, int, str]]
+        """
+        empty = ~(code | code >> 1 | code >> 2) & low_bits
+        while empty:
+            lowest = empty & -empty
+            empty ^= lowest
+            for shift, anchor_moves in by_blank[lowest.bit_length() // 3]:
+                for empty_mask, delta, cell, direction in anchor_moves[(code >> shift) & 7]:
+                    if not code & empty_mask:
+                        yield code ^ delta, cell, direction
+    return blank_successors
+
+
+def _make_slides(move_table, width):
+    """
+    :param move_table: A table built by _build_move_table.
+    :type move_table: List[Tuple[List[Tuple[int, int, int, str]], ...]]
+    :param width: The number of columns of the board.
+    :type width: int
+    :return: The slides and slide_successors generators over that table.
+    :rtype: Tuple[Callable, Callable]
+    """
+    # change of the anchor cell of a piece moving one cell in each direction
+    offsets = {name: width * dr + dc for name, (dr, dc) in directions.items()}
+    cells = len(move_table)
+
+    def slides(code):
+        """
+        Generate every board reachable from an encoded board by sliding a single
+        piece any number of cells, turning corners where it fits: the usual
+        Klotski move metric. Each slide is found with the fewest cell steps.
+
+        :param code: The encoded board.
+        :type code: int
+        :return: Triples of (child code, cell of the moved piece, directions of
+            the cell steps of the slide).
+        :rtype: Iterator[Tuple[int, int, Tuple[str, ...]]]
+        """
+        for cell in range(cells):
+            value = (code >> (3 * cell)) & 7
+            if not move_table[cell][value]:
+                continue
+            # breadth-first over the positions of this piece alone
+            seen = {code}
+            frontier = [(code, cell, ())]
+            while frontier:
+                next_frontier = []
+                for board, anchor, steps in frontier:
+                    for empty_mask, delta, _, direction in move_table[anchor][value]:
+                        if not board & empty_mask:
+                            child = board ^ delta
+                            if child not in seen:
+                                seen.add(child)
+                                child_steps = steps + (direction,)
+                                yield child, cell, child_steps
+                                next_frontier.append(
+                                    (child, anchor + offsets[direction], child_steps))
+                frontier = next_frontier
+
+    def slide_successors(code):
+        """
+        Generate every board reachable from an encoded board with one slide, in
+        the same form as successors.
+
+        :param code: The encoded board.
+        :type code: int
+        :return: Triples of (child code, cell of the moved piece, direction of
+            the first cell step).
+        :rtype: Iterator[Tuple[int, int, str]]
+        """
+        for child, cell, steps in slides(code):
+            yield child, cell, steps[0]
+
+    return slides, slide_successors
+
+
+def _make_is_goal(goal_cell):
+    """
+    :param goal_cell: The cell the top-left cell of the 2x2 piece has to reach.
+    :type goal_cell: int
+    :return: The goal test.
+    :rtype: Callable[[int], bool]
+    """
+    shift = 3 * goal_cell
+
+    def is_goal(code):
+        """
+        :param code: The encoded board.
+        :type code: int
+        :return: True if the 2x2 piece sits on the goal cell.
+        :rtype: bool
+        """
+        return (code >> shift) & 7 == CELL_GOAL
+    return is_goal
+
+
+# ====================================================================================
+# Symmetry.
+#
+# When the goal area is centred, the board and the goal area are symmetric under
+# reflection through the vertical axis, so a board and its mirror image are the
+# same distance from a goal. The
+# search can store only the smaller of the two codes in its visited set; the
+# states it keeps still hold the real boards, so paths are unaffected.
+
+
+# Mirror tables work on chunks of this many cells of a row, so that they stay
+# small on wide boards. Rows of up to _mirror_row_width cells get a table of
+# whole rows instead, 8**width entries composed from the chunk tables, so that
+# mirroring takes one lookup per row.
+_mirror_chunk = 4
+_mirror_row_width = 6
+
+
+def _build_chunk_mirror_table(length):
+    """
+    :param length: The number of cells of the chunk.
+    :type length: int
+    :return: For every chunk of a row of an encoded board, the same cells in
+        reverse order with '<' and '>' swapped. The goal piece's top-left cell
+        ends up right of its body and has to be moved back.
+    :rtype: List[int]
+    """
+    swap = {CELL_LEFT: CELL_RIGHT, CELL_RIGHT: CELL_LEFT}
+    table = []
+    for chunk in range(1 << (3 * length)):
+        mirrored = 0
+        for col in range(length):
+            value = (chunk >> (3 * col)) & 7
+            mirrored |= swap.get(value, value) << (3 * (length - 1 - col))
+        table.append(mirrored)
+    return table
+
+
+def _build_row_mirror_table(width):
+    """
+    :param width: The number of columns of the board, at most twice
+        _mirror_chunk.
+    :type width: int
+    :return: The chunk mirror table of a whole row of the board.
+    :rtype: List[int]
+    """
+    if width <= _mirror_chunk:
+        return _build_chunk_mirror_table(width)
+    low_table = _build_chunk_mirror_table(_mirror_chunk)
+    high_table = _build_chunk_mirror_table(width - _mirror_chunk)
+    low_bits = 3 * _mirror_chunk
+    low_mask = (1 << low_bits) - 1
+    # the first cells of the row end up last
+    low_shift = 3 * (width - _mirror_chunk)
+    return [low_table[row & low_mask] << low_shift | high_table[row >> low_bits]
+            for row in range(1 << (3 * width))]
+
+
+def _make_mirror(width, height, symmetric):
+    """
+    :param width: The number of columns of the board.
+    :type width: int
+    :param height: The number of rows of the board.
+    :type height: int
+    :param symmetric: Whether the goal area is centred, so that mirror images
+        may be merged.
+    :type symmetric: bool
+    :return: The mirror_code and canonical_code functions of the board size,
+        mirror_code being None when the board is not symmetric.
+    :rtype: Tuple[Optional[Callable[[int], int]], Callable[[int], int]]
+    """
+    if not symmetric:
+        def canonical_code(code):
+            """
+            :param code: The encoded board.
+            :type code: int
+            :return: The code itself: without a centred goal area, mirror
+                images are different boards.
+            :rtype: int
+            """
+            return code
+
+        return None, canonical_code
+
+    row_bits = 3 * width
+    row_mask = (1 << row_bits) - 1
+    low_bits = sum(1 << (3 * cell) for cell in range(width * height))
+    goal_swap = CELL_GOAL ^ CELL_GOAL_BODY
+
+    if width <= _mirror_row_width and height == 5:
+        # the classic height, unrolled: mirroring is on the hot path of
+        # symmetric searches
+        row_mirror = _build_row_mirror_table(width)
+        shift_1, shift_2, shift_3, shift_4 = range(row_bits, 5 * row_bits, row_bits)
+
+        def mirror_code(code):
+            """
+            :param code: The encoded board.
+            :type code: int
+            :return: The encoding of the board reflected left to right.
+            :rtype: int
+            """
+            mirrored = (row_mirror[code & row_mask]
+                        | row_mirror[(code >> shift_1) & row_mask] << shift_1
+                        | row_mirror[(code >> shift_2) & row_mask] << shift_2
+                        | row_mirror[(code >> shift_3) & row_mask] << shift_3
+                        | row_mirror[(code >> shift_4) & row_mask] << shift_4)
+            # move the goal piece's top-left cell back left of its body
+            head = mirrored & ~(mirrored >> 1) & ~(mirrored >> 2) & low_bits
+            return mirrored ^ (head | head >> 3) * goal_swap
+    elif width <= _mirror_row_width:
+        row_mirror = _build_row_mirror_table(width)
+        shifts = range(0, row_bits * height, row_bits)
+
+        def mirror_code(code):
+            """
+            :param code: The encoded board.
+            :type code: int
+            :return: The encoding of the board reflected left to right.
+            :rtype: int
+            """
+            mirrored = 0
+            for shift in shifts:
+                mirrored |= row_mirror[(code >> shift) & row_mask] << shift
+            # move the goal piece's top-left cell back left of its body
+            head = mirrored & ~(mirrored >> 1) & ~(mirrored >> 2) & low_bits
+            return mirrored ^ (head | head >> 3) * goal_swap
+    else:
+        # (shift, mask, table, shift of the mirror image) of every chunk
+        chunks = []
+        tables = {}
+        for row in range(height):
+            for col in range(0, width, _mirror_chunk):
+                length = min(_mirror_chunk, width - col)
+                if length not in tables:
+                    tables[length] = _build_chunk_mirror_table(length)
+                chunks.append((row_bits * row + 3 * col, (1 << (3 * length)) - 1,
+                               tables[length], row_bits * row + 3 * (width - col - length)))
+
+        def mirror_code(code):
+            """
+            :param code: The encoded board.
+            :type code: int
+            :return: The encoding of the board reflected left to right.
+            :rtype: int
+            """
+            mirrored = 0
+            for shift, mask, table, mirror_shift in chunks:
+                mirrored |= table[(code >> shift) & mask] << mirror_shift
+            # move the goal piece's top-left cell back left of its body
+            head = mirrored & ~(mirrored >> 1) & ~(mirrored >> 2) & low_bits
+            return mirrored ^ (head | head >> 3) * goal_swap
+
+    def canonical_code(code):
+        """
+        :param code: The encoded board.
+        :type code: int
+        :return: The smaller of the board's code and its mirror image's code.
+        :rtype: int
+        """
+        mirrored = mirror_code(code)
+        return mirrored if mirrored < code else code
+
+    return mirror_code, canonical_code
+
+
+# ====================================================================================
+# Search nodes.
+#
+# The search functions keep their nodes in a NodeStore rather than as a chain of
+# States: a node is an index into parallel arrays of encoded boards, parent
+# indices, depths and f values, which takes a few dozen bytes per node. States
+# are only built for the boards on the path that is returned.
+
+
+class NodeStore:
+    """
+    Search nodes stored as parallel arrays, a node being its index.
+    """
+
+    __slots__ = ('codes', 'parents', 'depths', 'fs')
+
+    def __init__(self, wide=False):
+        """
+        :param wide: Whether codes may need more than 64 bits, in which case
+            they are kept in a list.
+        :type wide: bool
+        """
+        self.codes = [] if wide else array('Q')
+        self.parents = array('q')
+        self.depths = array('L')
+        self.fs = array('L')
+
+    def add(self, code, parent, depth, f=0):
+        """
+        :param code: The encoded board of the node.
+        :type code: int
+        :param parent: The index of the parent node, or -1 for a root.
+        :type parent: int
+        :param depth: The depth of the node in the search tree.
+        :type depth: int
+        :param f: The f value of the node.
+        :type f: int
+        :return: The index of the new node.
+        :rtype: int
+        """
+        self.codes.append(code)
+        self.parents.append(parent)
+        self.depths.append(depth)
+        self.fs.append(f)
+        return len(self.codes) - 1
+
+    def path(self, index):
+        """
+        :param index: A node index.
+        :type index: int
+        :return: The encoded boards from the root down to the node.
+        :rtype: List[int]
+        """
+        codes = []
+        while index >= 0:
+            codes.append(self.codes[index])
+            index = self.parents[index]
+        codes.reverse()
+        return codes
+
+    def closest(self, heuristic):
+        """
+        :param heuristic: Maps an encoded board to an estimate of its distance.
+        :type heuristic: Callable[[int], int]
+        :return: The index of the first node with the smallest estimate.
+        :rtype: int
+        """
+        codes = self.codes
+        return min(range(len(codes)), key=lambda index: heuristic(codes[index]))
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised inside a search when it reaches one of the limits of its
+    SearchStats. The search sets best, the path to the board with the
+    smallest heuristic it has seen, before passing it on.
+    """
+
+    def __init__(self, reason):
+        """
+        :param reason: The limit that was reached: 'time-limit', 'node-limit'
+            or 'visited-limit'.
+        :type reason: str
+        """
+        super().__init__(reason)
+        self.reason = reason
+        self.best = None
+
+
+class SearchStats:
+    """
+    Instrumentation of a search. The search functions add their counters every
+    interval expansions and when they end, and call progress with this object
+    each time. With timers set, the time spent in each phase of the search is
+    summed in phases: generate (move generation), heuristic, hash (board keys
+    and open list duplicate checks) and queue (open list pushes and pops).
+
+    The limits are checked at every report; a search that reaches one raises
+    BudgetExceeded. Reports come at least every time_check_interval
+    expansions under a time limit, exactly at max_expanded expansions and,
+    for searches adding one board per expansion, at max_visited boards.
+    Searches adding boards as they generate them check max_visited
+    themselves.
+    """
+
+    __slots__ = ('expanded', 'generated', 'duplicates', 'open_size', 'peak_open',
+                 'peak_visited', 'phases', 'progress', 'interval', 'start',
+                 'max_time', 'max_expanded', 'max_visited')
+
+    time_check_interval = 1000
+
+    def __init__(self, progress=None, interval=10000, timers=False, max_time=None,
+                 max_expanded=None, max_visited=None):
+        """
+        :param progress: Called with this object every interval expansions and
+            when the search ends, or None.
+        :type progress: Optional[Callable[[SearchStats], None]]
+        :param interval: The number of expansions between two reports.
+        :type interval: int
+        :param timers: Time the phases of the search. This slows it down.
+        :type timers: bool
+        :param max_time: Seconds after the creation of this object at which the
+            search stops, or None.
+        :type max_time: Optional[float]
+        :param max_expanded: The number of expansions at which the search
+            stops, or None.
+        :type max_expanded: Optional[int]
+        :param max_visited: The visited set size at which the search stops, or
+            None.
+        :type max_visited: Optional[int]
+        """
+        # boards expanded, children generated and children dropped as already seen
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        # open list size at the last report and the largest one reported
+        self.open_size = 0
+        self.peak_open = 0
+        # the largest number of boards in the visited set or transposition table
+        self.peak_visited = 0
+        self.phases = {} if timers else None
+        self.progress = progress
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.max_time = max_time
+        self.max_expanded = max_expanded
+        self.max_visited = max_visited
+
+    def report(self, expanded, generated, duplicates, open_size, visited):
+        """
+        Add the counts since the last report and call progress.
+
+        :param expanded: Boards expanded since the last report.
+        :type expanded: int
+        :param generated: Children generated since the last report.
+        :type generated: int
+        :param duplicates: Children dropped since the last report.
+        :type duplicates: int
+        :param open_size: The current size of the open list.
+        :type open_size: int
+        :param visited: The current size of the visited set.
+        :type visited: int
+        """
+        self.expanded += expanded
+        self.generated += generated
+        self.duplicates += duplicates
+        self.open_size = open_size
+        self.peak_open = max(self.peak_open, open_size)
+        self.peak_visited = max(self.peak_visited, visited)
+        if self.progress is not None:
+            self.progress(self)
+
+    def check(self):
+        """
+        Raise BudgetExceeded if a limit has been reached.
+
+        :return: The number of expansions until the next report is due.
+        :rtype: int
+        """
+        interval = self.interval
+        if self.max_expanded is not None:
+            if self.expanded >= self.max_expanded:
+                raise BudgetExceeded('node-limit')
+            interval = min(interval, self.max_expanded - self.expanded)
+        if self.max_visited is not None:
+            if self.peak_visited >= self.max_visited:
+                raise BudgetExceeded('visited-limit')
+            interval = min(interval, self.max_visited - self.peak_visited)
+        if self.max_time is not None:
+            if self.elapsed() >= self.max_time:
+                raise BudgetExceeded('time-limit')
+            interval = min(interval, self.time_check_interval)
+        return interval
+
+    def timed(self, phase, function, generator=False):
+        """
+        :param phase: The phase the time is added to.
+        :type phase: str
+        :param function: The function to time.
+        :type function: Callable
+        :param generator: The function returns a generator, which is run to the
+            end inside the timer.
+        :type generator: bool
+        :return: function itself when not timing, otherwise a wrapper adding
+            its run time to phases[phase].
+        :rtype: Callable
+        """
+        if self.phases is None:
+            return function
+        phases = self.phases
+        phases.setdefault(phase, 0.0)
+        clock = time.perf_counter
+
+        def timed_function(*args):
+            start = clock()
+            result = function(*args)
+            if generator:
+                result = iter(list(result))
+            phases[phase] += clock() - start
+            return result
+        return timed_function
+
+    def elapsed(self):
+        """
+        :return: Seconds since this object was created.
+        :rtype: float
+        """
+        return time.perf_counter() - self.start
+
+    def as_dict(self):
+        """
+        :return: The counters, and the phase times if timed.
+        :rtype: Dict[str, Any]
+        """
+        result = {name: getattr(self, name) for name in
+                  ('expanded', 'generated', 'duplicates', 'open_size', 'peak_open',
+                   'peak_visited')}
+        if self.phases is not None:
+            result['phases'] = dict(self.phases)
+        return result
+
+
+def chain_states(initial_state, codes):
+    """
+    Turn a path of encoded boards into a chain of States hanging off
+    initial_state, as returned by the search functions.
+
+    :param initial_state: The state holding the first board of the path.
+    :type initial_state: State
+    :param codes: The encoded boards after the first one.
+    :type codes: Iterable[int]
+    :return: The state holding the last board of the path.
+    :rtype: State
+    """
+    geometry = initial_state.board.geometry
+    state = initial_state
+    for code in codes:
+        state = State(decode_board(code, geometry), 0, state.depth + 1, state)
+    return state
+
+
+def dfs(initial_state, symmetric=False, visited=None, stats=None, moves=None):
+    # visited holds every board seen so far; a fresh set is used unless the caller passes one
+    # with symmetric set, a board and its mirror image share one entry
+    # the counters are reported to stats, if given
+    # moves is the move generator of the move metric, one of the geometry's metrics;
+    # None is the step metric
+    geometry = initial_state.board.geometry
+    is_goal = geometry.is_goal
+    if moves is None:
+        moves = geometry.successors
+    if visited is None:
+        visited = set()
+    if stats is None:
+        stats = SearchStats()
+    generate = stats.timed('generate', moves, True)
+    canonical = stats.timed('hash', geometry.canonical_code)
+
+    # boards are added to visited as they are generated, so its limit is checked there
+    max_visited = stats.max_visited if stats.max_visited is not None else float('inf')
+
+    # the frontier queue used by the dfs (stack) holds node indices
+    nodes = NodeStore(geometry.wide)
+    stack = [nodes.add(encode_board(initial_state.board), -1, initial_state.depth)]
+    push = stats.timed('queue', stack.append)
+    pop = stats.timed('queue', stack.pop)
+    expanded = generated = duplicates = 0
+
+    try:
+        interval = stats.check()
+        while len(stack):
+            index = pop()
+            expanded += 1
+            if expanded >= interval:
+                stats.report(expanded, generated, duplicates, len(stack), len(visited))
+                expanded = generated = duplicates = 0
+                interval = stats.check()
+
+            code = nodes.codes[index]
+            visited.add(canonical(code) if symmetric else code)
+            if is_goal(code):
+                return chain_states(initial_state, nodes.path(index)[1:])
+
+            depth = nodes.depths[index] + 1
+            for child, cell, direction in generate(code):
+                generated += 1
+                # check duplicate
+                key = canonical(child) if symmetric else child
+                if key not in visited:
+                    visited.add(key)
+                    if len(visited) >= max_visited:
+                        raise BudgetExceeded('visited-limit')
+                    push(nodes.add(child, index, depth))
+                else:
+                    duplicates += 1
+    except BudgetExceeded as exceeded:
+        closest = nodes.closest(geometry.heuristics['manhattan'])
+        exceeded.best = chain_states(initial_state, nodes.path(closest)[1:])
+        raise
+    finally:
+        stats.report(expanded, generated, duplicates, len(stack), len(visited))
 
 
 def dfs_backtrace(final_state, initial_state):
+    # final_state is None when the search found no solution
+    if final_state is None:
+        sys.stdout.write(format_grid_path([]))
+        return
     path = []
     while final_state != initial_state:
-        path.append(final_state.board)
+        path.append(encode_board(final_state.board))
         final_state = final_state.parent
-    path.append(initial_state.board)
+    path.append(encode_board(initial_state.board))
     path.reverse()
-    print(len(path))
-    for graph in path:
-        graph.display()
-        print('\n')
-
-
-def astar(initial_state):
-    # try to use Manhattan distance heuristic for our function check the distance from the top left corner of 2x2
-    # tile to the goal state, which is grid[3][1] for that specific tile (need to ignore fewer rules,
-    # consider different shapes of the tile, how to deal with different shapes) also, could add up all the Manhattan
-    # distance for the total four tiles a list that contains all the visited board and if encounter the same
-    # situation, discard the one has more depth
-
-    # the frontier queue used by the dfs (stack)
-    # first_state = State(game_board, 0, 0, None)
-    # board_visited.append(first_state)
-    stack = []
-    initial_list = [initial_state.f + initial_state.depth, initial_state.id, initial_state]
-    heappush(stack, initial_list)
-
-    while len(stack):
-        next_list = heappop(stack)
-
-        next_state = next_list[2]
-        if str(next_state.board.grid) not in board_visited_set:
-            board_visited_set.add(str(next_state.board.grid))
-        game_board = next_state.board
-        board_grid = next_state.board.grid
-        # find the coordinate of two white space of two white space
-        if board_grid[3][1] == char_goal and board_grid[3][2] == char_goal \
-                and board_grid[4][1] == char_goal and board_grid[4][2] == char_goal:
-            return next_state
-
-        for x in range(0, 5):
-            for y in range(0, 4):
-                if board_grid[x][y] == '^':
-                    # move to the left for 2x1 (vertical)
-                    if y != 0:
-                        if board_grid[x][y - 1] == '.' and board_grid[x + 1][y - 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x + 1][y] = '.'
-                            game_board_copy.grid[x][y - 1] = '^'
-                            game_board_copy.grid[x + 1][y - 1] = 'v'
-
-                            # check duplicate
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                    # move to the right for 2x1 (vertical)
-                    if y != 3:
-                        if board_grid[x][y + 1] == '.' and board_grid[x + 1][y + 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x + 1][y] = '.'
-                            game_board_copy.grid[x][y + 1] = '^'
-                            game_board_copy.grid[x + 1][y + 1] = 'v'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                    # move to the top for 2x1 (vertical)
-                    if x != 0:
-                        if board_grid[x - 1][y] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = 'v'
-                            game_board_copy.grid[x - 1][y] = '^'
-                            game_board_copy.grid[x + 1][y] = '.'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                    # move down the 2x1 (vertical)
-                    if x < 3:
-                        if board_grid[x + 2][y] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x + 1][y] = '^'
-                            game_board_copy.grid[x + 2][y] = 'v'
-                            # form a new state and add it into the stack for future search
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                # if the grid is a single 1x1
-                elif board_grid[x][y] == char_single:
-                    if x != 4:
-                        if board_grid[x + 1][y] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x + 1][y] = char_single
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                    if x != 0:
-                        if board_grid[x - 1][y] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x - 1][y] = char_single
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                    if y != 3:
-                        if board_grid[x][y + 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x][y + 1] = char_single
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                    if y != 0:
-                        if board_grid[x][y - 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x][y - 1] = char_single
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                elif board_grid[x][y] == '<':
-                    # move the 1x2 to the left
-                    if y != 0:
-                        if board_grid[x][y - 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '>'
-                            game_board_copy.grid[x][y + 1] = '.'
-                            game_board_copy.grid[x][y - 1] = '<'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                    if y < 2:
-                        if board_grid[x][y + 2] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x][y + 1] = '<'
-                            game_board_copy.grid[x][y + 2] = '>'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                    if x != 0:
-                        if board_grid[x - 1][y] == '.' and board_grid[x - 1][y + 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x][y + 1] = '.'
-                            game_board_copy.grid[x - 1][y] = '<'
-                            game_board_copy.grid[x - 1][y + 1] = '>'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                    if x != 4:
-                        if board_grid[x + 1][y] == '.' and board_grid[x + 1][y + 1] == '.':
-                            game_board_copy = deepcopy(game_board)
-                            game_board_copy.grid[x][y] = '.'
-                            game_board_copy.grid[x][y + 1] = '.'
-                            game_board_copy.grid[x + 1][y] = '<'
-                            game_board_copy.grid[x + 1][y + 1] = '>'
-                            if str(game_board_copy.grid) not in board_visited_set:
-                                board_visited_set.add(str(game_board_copy.grid))
-                                new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                next_list = [next_state.f + next_state.depth, new_state.id, new_state]
-                                heappush(stack, next_list)
-                # The grid is the top left corner of the 2x2
-                elif x < 4 and y < 3:
-                    if board_grid[x][y] == char_goal \
-                            and board_grid[x + 1][y] == char_goal \
-                            and board_grid[x][y + 1] == char_goal:
-                        # move to the left
-                        if y != 0:
-                            if board_grid[x][y - 1] == '.' and board_grid[x + 1][y - 1] == '.':
-                                game_board_copy = deepcopy(game_board)
-                                game_board_copy.grid[x][y - 1] = char_goal
-                                game_board_copy.grid[x + 1][y - 1] = char_goal
-                                game_board_copy.grid[x][y + 1] = '.'
-                                game_board_copy.grid[x + 1][y + 1] = '.'
-
-                                if str(game_board_copy.grid) not in board_visited_set:
-                                    distance = abs(x - 3) + abs(y - 2)
-                                    if distance < next_state.f:
-                                        next_state.f = next_state.f - 1
-                                    if distance > next_state.f:
-                                        next_state.f = next_state.f + 1
-                                    board_visited_set.add(str(game_board_copy.grid))
-                                    new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                    next_list = [new_state.f + next_state.depth, new_state.id, new_state]
-                                    heappush(stack, next_list)
-                        # move to the right
-                        if y < 2:
-                            if board_grid[x][y + 2] == '.' and board_grid[x + 1][y + 2] == '.':
-                                game_board_copy = deepcopy(game_board)
-                                game_board_copy.grid[x][y] = '.'
-                                game_board_copy.grid[x + 1][y] = '.'
-                                game_board_copy.grid[x][y + 2] = char_goal
-                                game_board_copy.grid[x + 1][y + 2] = char_goal
-                                if str(game_board_copy.grid) not in board_visited_set:
-                                    distance = abs(x - 3) + abs(y)
-                                    if distance < next_state.f:
-                                        next_state.f = next_state.f - 1
-                                    if distance > next_state.f:
-                                        next_state.f = next_state.f + 1
-                                    board_visited_set.add(str(game_board_copy.grid))
-                                    new_state = State(game_board_copy, next_state.f, next_state.depth + 1, next_state)
-                                    next_list = [new_state.f + next_state.depth, new_state.id, new_state]
-                                    heappush(stack, next_list)
-                        # move to the top
-                        if x != 0:
-                            if board_grid[x - 1][y] == '.' and board_grid[x - 1][y + 1] == '.':
-                                game_board_copy = deepcopy(game_board)
-                                game_board_copy.grid[x - 1][y] = char_goal
-                                game_board_copy.grid[x - 1][y + 1] = char_goal
-                                game_board_copy.grid[x + 1][y] = '.'
-                                game_board_copy.grid[x + 1][y + 1] = '.'
-                                if str(game_board_copy.grid) not in board_visited_set:
-                                    board_visited_set.add(str(game_board_copy.grid))
-                                    new_state = State(game_board_copy, next_state.f + 1, next_state.depth + 1, next_state)
-                                    next_list = [next_state.f + 1 + next_state.depth, new_state.id, new_state]
-                                    heappush(stack, next_list)
-                        # move down the grid
-                        if x < 3:
-                            if board_grid[x + 2][y] == '.' and board_grid[x + 2][y + 1] == '.':
-                                game_board_copy = deepcopy(game_board)
-                                game_board_copy.grid[x][y] = '.'
-                                game_board_copy.grid[x][y + 1] = '.'
-                                game_board_copy.grid[x + 2][y] = char_goal
-                                game_board_copy.grid[x + 2][y + 1] = char_goal
-                                if str(game_board_copy.grid) not in board_visited_set:
-                                    board_visited_set.add(str(game_board_copy.grid))
-                                    new_state = State(game_board_copy, next_state.f - 1, next_state.depth + 1, next_state)
-                                    next_list = [next_state.f - 1 + next_state.depth, new_state.id, new_state]
-                                    heappush(stack, next_list)
+    sys.stdout.write(format_grid_path(path, initial_state.board.geometry))
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--inputfile",
-        type=str,
-        required=True,
-        help="The input file that contains the puzzle."
-    )
-    parser.add_argument(
-        "--outputfile",
-        type=str,
-        required=True,
-        help="The output file that contains the solution."
-    )
-    parser.add_argument(
-        "--algo",
-        type=str,
-        required=True,
-        choices=['astar', 'dfs'],
-        help="The searching algorithm."
-    )
-    args = parser.parse_args()
-    # read the board from the file
-    # redirect stdout to output file
-    board = read_from_file(args.inputfile)
-    sys.stdout = open(args.outputfile, 'w')
-
-    if args.algo == 'dfs':
-        first_state = State(board, 0, 0, None)
-        board_visited.append(first_state)
-        last_state = dfs(first_state)
-        dfs_backtrace(last_state, first_state)
-
-    if args.algo == 'astar':
-        f_value = 0
-        for x1 in range(0, 5):
-            for y1 in range(0, 4):
-                if x1 != 4 and y1 != 3:
-                    if board.grid[x1][y1] == char_goal and board.grid[x1 + 1][y1] == char_goal and board.grid[x1][y1 + 1] == char_goal:
-                        x_coor = x1
-                        y_coor = y1
-                        f_value = abs(x_coor - 3) + abs(y_coor - 1)
-                        break
-        first_state = State(board, 0, f_value, None)
-        last_state = astar(first_state)
-        dfs_backtrace(last_state, first_state)
+# ====================================================================================
+# Heuristics.
+#
+# A heuristic maps an encoded board to a lower bound on the number of moves left.
+# Both heuristics below are admissible and consistent: one move shifts one piece by
+# one cell, so it changes each term by at most one.
+
+
+def _build_blocker_table():
+    """
+    :return: For every packing of the four cells of the goal area, the number
+        of distinct pieces other than the goal piece covering them.
+    :rtype: List[int]
+    """
+    table = []
+    for key in range(1 << 12):
+        a, b, c, d = [(key >> (3 * i)) & 7 for i in range(4)]
+        count = sum(1 for value in (a, b, c, d)
+                    if value not in (CELL_EMPTY, CELL_GOAL, CELL_GOAL_BODY))
+        # pieces covering two cells of the goal area are counted once
+        if a == CELL_UP and c == CELL_DOWN:
+            count -= 1
+        if b == CELL_UP and d == CELL_DOWN:
+            count -= 1
+        if a == CELL_LEFT and b == CELL_RIGHT:
+            count -= 1
+        if c == CELL_LEFT and d == CELL_RIGHT:
+            count -= 1
+        table.append(count)
+    return table
+
+
+_blockers = _build_blocker_table()
+
+
+def _make_heuristics(width, height, goal):
+    """
+    :param width: The number of columns of the board.
+    :type width: int
+    :param height: The number of rows of the board.
+    :type height: int
+    :param goal: The (row, col) the top-left cell of the 2x2 piece has to reach.
+    :type goal: Tuple[int, int]
+    :return: goal_position, slide_length, and the heuristics by name for the
+        step and the slide metric.
+    :rtype: Tuple[Callable, Callable, Dict[str, Callable], Dict[str, Callable]]
+    """
+    goal_row, goal_col = goal
+    row_bits = 3 * width
+    # the two rows of the goal area, as in the keys of _blockers
+    upper_shift = 3 * (goal_row * width + goal_col)
+    lower_shift = upper_shift + row_bits
+    # set bits at the lowest bit of every cell
+    cell_low_bits = sum(1 << (3 * cell) for cell in range(width * height))
+    cells = width * height
+
+    def goal_position(code):
+        """
+        :param code: The encoded board.
+        :type code: int
+        :return: The (row, col) of the top-left cell of the 2x2 piece.
+        :rtype: Tuple[int, int]
+        """
+        # the only cell holding CELL_GOAL, with bit 0 set and bits 1 and 2 clear
+        head = code & ~(code >> 1) & ~(code >> 2) & cell_low_bits
+        if not head:
+            raise ValueError('board has no 2x2 piece')
+        return divmod((head.bit_length() - 1) // 3, width)
+
+    def manhattan_heuristic(code):
+        """
+        Manhattan distance of the 2x2 piece to the goal cell.
+
+        :param code: The encoded board.
+        :type code: int
+        :rtype: int
+        """
+        row, col = goal_position(code)
+        return abs(row - goal_row) + abs(col - goal_col)
+
+    def blocking_heuristic(code):
+        """
+        Manhattan distance of the 2x2 piece plus one for every other piece that
+        covers part of the goal area, since each of those has to move at least
+        once.
+
+        :param code: The encoded board.
+        :type code: int
+        :rtype: int
+        """
+        row, col = goal_position(code)
+        key = ((code >> upper_shift) & 0x3F) | (((code >> lower_shift) & 0x3F) << 6)
+        return abs(row - goal_row) + abs(col - goal_col) + _blockers[key]
+
+    def slide_length(code):
+        """
+        The most cells of Manhattan distance the 2x2 piece can cover in one
+        slide. Every cell it enters was empty at the start of the slide and
+        each cell of distance takes two of them.
+
+        :param code: The encoded board.
+        :type code: int
+        :rtype: int
+        """
+        occupied = bin((code | code >> 1 | code >> 2) & cell_low_bits).count('1')
+        return max(1, (cells - occupied) // 2)
+
+    def slide_manhattan_heuristic(code):
+        """
+        manhattan_heuristic for the slide metric: the slides the 2x2 piece
+        needs to cover its distance to the goal cell.
+
+        :param code: The encoded board.
+        :type code: int
+        :rtype: int
+        """
+        return -(-manhattan_heuristic(code) // slide_length(code))
+
+    def slide_blocking_heuristic(code):
+        """
+        blocking_heuristic for the slide metric. Every blocking piece still has
+        to move at least once, and one slide moves one piece.
+
+        :param code: The encoded board.
+        :type code: int
+        :rtype: int
+        """
+        key = ((code >> upper_shift) & 0x3F) | (((code >> lower_shift) & 0x3F) << 6)
+        return slide_manhattan_heuristic(code) + _blockers[key]
+
+    heuristics = {
+        'manhattan': manhattan_heuristic,
+        'blocking': blocking_heuristic,
+    }
+    # the heuristics above under the same names, for the slide metric
+    slide_heuristics = {
+        'manhattan': slide_manhattan_heuristic,
+        'blocking': slide_blocking_heuristic,
+    }
+    return goal_position, slide_length, heuristics, slide_heuristics
+
+
+# ====================================================================================
+# Geometries.
+#
+# A Geometry holds everything that depends on the size of the board and on where
+# the 2x2 piece has to go: the move table, the goal test, the symmetry and
+# heuristic tables, and the functions closing over them. It is built once per
+# size and shared, so larger boards run the same per-node code as the classic 5x4
+# board, only on wider codes. Boards carry their geometry and the searches take it
+# from the initial board. The pieces are the same on every board; the 3-bit cell
+# code has no room for more kinds.
+
+
+class Geometry:
+    """
+    The dimensions of a board and the cell its 2x2 piece has to reach, with the
+    tables and functions built for them. get_geometry shares them.
+    """
+
+    def __init__(self, width=4, height=5, goal=None):
+        """
+        :param width: The number of columns, at least 2.
+        :type width: int
+        :param height: The number of rows, at least 2.
+        :type height: int
+        :param goal: The (row, col) the top-left cell of the 2x2 piece has to
+            reach, or None for the middle of the two bottom rows.
+        :type goal: Optional[Tuple[int, int]]
+        """
+        if width < 2 or height < 2:
+            raise ValueError('boards must be at least 2x2')
+        if goal is None:
+            goal = (height - 2, (width - 2) // 2)
+        goal_row, goal_col = goal
+        if not (0 <= goal_row <= height - 2 and 0 <= goal_col <= width - 2):
+            raise ValueError('a 2x2 piece does not fit at {} on a {}x{} board'.format(
+                tuple(goal), height, width))
+        self.width = width
+        self.height = height
+        self.goal = (goal_row, goal_col)
+        self.cells = width * height
+        self.goal_cell = goal_row * width + goal_col
+        # the lowest bit of every cell, and of the cells of the last column
+        self.low_bits = sum(1 << (3 * cell) for cell in range(self.cells))
+        self.right_edge = sum(1 << (3 * (row * width + width - 1)) for row in range(height))
+        # codes of more than 64 bits do not fit the arrays of a NodeStore
+        self.wide = 3 * self.cells > 64
+        # mirror images are only interchangeable when the goal area is centred
+        self.symmetric = goal_col == width - 2 - goal_col
+        self.move_table = _build_move_table(width, height)
+        self.successors = _make_successors(self.move_table)
+        self.blank_successors = _make_blank_successors(self.move_table)
+        self.slides, self.slide_successors = _make_slides(self.move_table, width)
+        # move metrics: the move generator that makes one move under each of them,
+        # 'step' moving a piece by one cell and 'slide' by any distance
+        self.metrics = {'step': self.successors, 'slide': self.slide_successors}
+        self.is_goal = _make_is_goal(self.goal_cell)
+        self.mirror_code, self.canonical_code = _make_mirror(width, height, self.symmetric)
+        self.goal_position, self.slide_length, self.heuristics, self.slide_heuristics = \
+            _make_heuristics(width, height, self.goal)
+
+    @property
+    def key(self):
+        """
+        The arguments of get_geometry that return this geometry.
+        """
+        return self.width, self.height, self.goal
+
+    def __repr__(self):
+        return 'Geometry({}, {}, goal={})'.format(self.width, self.height, self.goal)
+
+
+# Geometries built so far, by key.
+_geometries = {}
+
+
+def get_geometry(width=4, height=5, goal=None):
+    """
+    :param width: The number of columns.
+    :type width: int
+    :param height: The number of rows.
+    :type height: int
+    :param goal: The (row, col) the top-left cell of the 2x2 piece has to
+        reach, or None for the middle of the two bottom rows.
+    :type goal: Optional[Tuple[int, int]]
+    :return: The shared geometry of that board.
+    :rtype: Geometry
+    """
+    if goal is None:
+        goal = (height - 2, (width - 2) // 2)
+    key = (width, height, tuple(goal))
+    geometry = _geometries.get(key)
+    if geometry is None:
+        geometry = _geometries[key] = Geometry(width, height, goal)
+    return geometry
+
+
+# The classic 5x4 board, with its tables and functions under module-level names.
+classic = get_geometry(4, 5)
+move_table = classic.move_table
+successors = classic.successors
+blank_successors = classic.blank_successors
+slides = classic.slides
+slide_successors = classic.slide_successors
+metrics = classic.metrics
+is_goal = classic.is_goal
+mirror_code = classic.mirror_code
+canonical_code = classic.canonical_code
+goal_position = classic.goal_position
+slide_length = classic.slide_length
+heuristics = classic.heuristics
+slide_heuristics = classic.slide_heuristics
+manhattan_heuristic = heuristics['manhattan']
+blocking_heuristic = heuristics['blocking']
+slide_manhattan_heuristic = slide_heuristics['manhattan']
+slide_blocking_heuristic = slide_heuristics['blocking']
+
+
+# ====================================================================================
+# A* search.
+#
+# The open list orders nodes by f, then by a tie-break key, then by a sequence
+# number that grows with every push. Nothing depends on hashes or object ids, so
+# the same board is expanded in the same order on every run. Each board has at
+# most one live entry: pushing it again with a smaller f supersedes the old entry,
+# which is dropped when it comes up (lazy deletion).
+
+# The tie-break key of a node is its depth times one of these factors; smaller
+# keys are expanded first. With f fixed, preferring deeper nodes is the same as
+# preferring lower h.
+tie_breaks = {
+    'deep': -1,
+    'shallow': 1,
+    'fifo': 0,
+}
+
+
+class OpenList:
+    """
+    Base class of the open lists, keeping track of the live entry of each
+    board. Subclasses implement push and pop.
+    """
+
+    __slots__ = ('tie_factor', 'sequence', 'live')
+
+    def __init__(self, tie_break='deep'):
+        """
+        :param tie_break: The name of the tie-break policy in tie_breaks.
+        :type tie_break: str
+        """
+        self.tie_factor = tie_breaks[tie_break]
+        self.sequence = 0
+        # board key -> (f, sequence) of its live entry
+        self.live = {}
+
+    def admits(self, key, f):
+        """
+        :param key: The board key, as used in the visited set.
+        :type key: int
+        :param f: The f value the board would be pushed with.
+        :type f: int
+        :return: False if the board is already open with an f no larger.
+        :rtype: bool
+        """
+        entry = self.live.get(key)
+        return entry is None or f < entry[0]
+
+    def push(self, f, depth, index, key):
+        """
+        :param f: The f value of the node.
+        :type f: int
+        :param depth: The depth of the node, used to break ties.
+        :type depth: int
+        :param index: The node index.
+        :type index: int
+        :param key: The board key; an earlier entry with the same key is dropped.
+        :type key: int
+        """
+        raise NotImplementedError
+
+    def pop(self):
+        """
+        :return: The index of the live node with the smallest
+            (f, tie key, sequence).
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self.live)
+
+
+class HeapOpenList(OpenList):
+    """
+    Open list on a binary heap.
+    """
+
+    __slots__ = ('heap',)
+
+    def __init__(self, tie_break='deep'):
+        super().__init__(tie_break)
+        self.heap = []
+
+    def push(self, f, depth, index, key):
+        self.sequence += 1
+        self.live[key] = (f, self.sequence)
+        heappush(self.heap, (f, self.tie_factor * depth, self.sequence, index, key))
+
+    def pop(self):
+        heap = self.heap
+        live = self.live
+        while True:
+            f, tie, sequence, index, key = heappop(heap)
+            if live.get(key) == (f, sequence):
+                del live[key]
+                return index
+
+
+class BucketOpenList(OpenList):
+    """
+    Open list of buckets, one per integer f, each split into first-in
+    first-out queues by tie key. Pushes are O(1) and pops only scan the few
+    tie keys of the current bucket. Expands nodes in the same order as
+    HeapOpenList.
+    """
+
+    __slots__ = ('buckets', 'min_f')
+
+    def __init__(self, tie_break='deep'):
+        super().__init__(tie_break)
+        # f -> tie key -> deque of (sequence, index, key)
+        self.buckets = {}
+        self.min_f = None
+
+    def push(self, f, depth, index, key):
+        self.sequence += 1
+        self.live[key] = (f, self.sequence)
+        tie = self.tie_factor * depth
+        bucket = self.buckets.get(f)
+        if bucket is None:
+            bucket = self.buckets[f] = {}
+        queue = bucket.get(tie)
+        if queue is None:
+            queue = bucket[tie] = deque()
+        queue.append((self.sequence, index, key))
+        if self.min_f is None or f < self.min_f:
+            self.min_f = f
+
+    def pop(self):
+        live = self.live
+        while True:
+            bucket = self.buckets.get(self.min_f)
+            while not bucket:
+                self.buckets.pop(self.min_f, None)
+                self.min_f += 1
+                bucket = self.buckets.get(self.min_f)
+            tie = min(bucket)
+            queue = bucket[tie]
+            sequence, index, key = queue.popleft()
+            if not queue:
+                del bucket[tie]
+            if live.get(key) == (self.min_f, sequence):
+                del live[key]
+                return index
+
+
+open_lists = {
+    'heap': HeapOpenList,
+    'bucket': BucketOpenList,
+}
+
+
+def astar(initial_state, heuristic=None, symmetric=False, visited=None,
+          tie_break='deep', open_list='heap', stats=None, moves=None):
+    """
+    A* search with f = depth + heuristic. Boards are closed when they are
+    expanded, so with a consistent heuristic the returned path is optimal.
+
+    :param initial_state: The state to search from; its f is filled in here.
+    :type initial_state: State
+    :param heuristic: Maps an encoded board to a lower bound of its distance,
+        or None for the geometry's manhattan heuristic.
+    :type heuristic: Optional[Callable[[int], int]]
+    :param symmetric: Treat a board and its mirror image as the same board.
+    :type symmetric: bool
+    :param visited: The set expanded boards are recorded in, or None for a
+        fresh one.
+    :type visited: Optional[Set[int]]
+    :param tie_break: How nodes with equal f are ordered, one of tie_breaks.
+    :type tie_break: str
+    :param open_list: The open list implementation, one of open_lists.
+    :type open_list: str
+    :param stats: The instrumentation to report to, or None.
+    :type stats: Optional[SearchStats]
+    :param moves: The move generator of the move metric, one of the
+        geometry's metrics, or None for the step metric with moves
+        generated from the empty cells.
+    :type moves: Optional[Callable[[int], Iterator[Tuple[int, int, str]]]]
+    :return: The goal state, or None if no goal is reachable.
+    :rtype: Optional[State]
+    """
+    geometry = initial_state.board.geometry
+    is_goal = geometry.is_goal
+    if heuristic is None:
+        heuristic = geometry.heuristics['manhattan']
+    if moves is None:
+        moves = geometry.blank_successors
+    if visited is None:
+        visited = set()
+    if stats is None:
+        stats = SearchStats()
+    generate = stats.timed('generate', moves, True)
+    heuristic = stats.timed('heuristic', heuristic)
+    canonical = stats.timed('hash', geometry.canonical_code)
+    start = encode_board(initial_state.board)
+    initial_state.f = initial_state.depth + heuristic(start)
+    nodes = NodeStore(geometry.wide)
+    stack = open_lists[open_list](tie_break)
+    push = stats.timed('queue', stack.push)
+    pop = stats.timed('queue', stack.pop)
+    admits = stats.timed('hash', stack.admits)
+    push(initial_state.f, initial_state.depth,
+         nodes.add(start, -1, initial_state.depth, initial_state.f),
+         canonical(start) if symmetric else start)
+    expanded = generated = duplicates = 0
+
+    try:
+        interval = stats.check()
+        while len(stack):
+            index = pop()
+            code = nodes.codes[index]
+            key = canonical(code) if symmetric else code
+            if key in visited:
+                continue
+            visited.add(key)
+            expanded += 1
+            if expanded >= interval:
+                stats.report(expanded, generated, duplicates, len(stack), len(visited))
+                expanded = generated = duplicates = 0
+                interval = stats.check()
+            if is_goal(code):
+                return chain_states(initial_state, nodes.path(index)[1:])
+
+            depth = nodes.depths[index] + 1
+            for child, cell, direction in generate(code):
+                generated += 1
+                key = canonical(child) if symmetric else child
+                if key in visited:
+                    duplicates += 1
+                    continue
+                f = depth + heuristic(child)
+                if admits(key, f):
+                    push(f, depth, nodes.add(child, index, depth, f), key)
+                else:
+                    duplicates += 1
+    except BudgetExceeded as exceeded:
+        exceeded.best = chain_states(initial_state, nodes.path(nodes.closest(heuristic))[1:])
+        raise
+    finally:
+        stats.report(expanded, generated, duplicates, len(stack), len(visited))
+
+
+def idastar(initial_state, heuristic=None, table_size=1 << 20, stats=None, moves=None):
+    """
+    Iterative-deepening A*: depth-first searches bounded by an f threshold that
+    grows to the smallest f that went over it. Only the current path and a
+    transposition table of at most table_size boards are kept, so memory stays
+    bounded. The table outlives the iterations: it keeps, for every board
+    searched, the lower bound of its distance learned from its children, so
+    a board reached again, in this or a later iteration, is only searched
+    again when its bound fits under the threshold. With an admissible
+    heuristic the returned path is optimal.
+
+    :param initial_state: The state to search from.
+    :type initial_state: State
+    :param heuristic: Maps an encoded board to a lower bound of its distance,
+        or None for the geometry's manhattan heuristic.
+    :type heuristic: Optional[Callable[[int], int]]
+    :param table_size: The most boards kept in the transposition table.
+    :type table_size: int
+    :param stats: The instrumentation to report to, or None.
+    :type stats: Optional[SearchStats]
+    :param moves: The move generator of the move metric, one of the
+        geometry's metrics, or None for the step metric with moves
+        generated from the empty cells.
+    :type moves: Optional[Callable[[int], Iterator[Tuple[int, int, str]]]]
+    :return: The goal state, or None if no goal is reachable.
+    :rtype: Optional[State]
+    """
+    geometry = initial_state.board.geometry
+    is_goal = geometry.is_goal
+    if heuristic is None:
+        heuristic = geometry.heuristics['manhattan']
+    if moves is None:
+        moves = geometry.blank_successors
+    start = encode_board(initial_state.board)
+    if is_goal(start):
+        return initial_state
+    if stats is None:
+        stats = SearchStats()
+    generate = stats.timed('generate', moves, True)
+    heuristic = stats.timed('heuristic', heuristic)
+    threshold = heuristic(start)
+    expanded = generated = duplicates = 0
+    # the path plays the part of the open list
+    path = [start]
+    # board -> twice the lower bound of its distance learned by searching it,
+    # plus one if the search was cut by the threshold somewhere below it
+    table = {}
+
+    try:
+        interval = stats.check()
+        while True:
+            path = [start]
+            on_path = {start}
+            iterators = [generate(start)]
+            # for every board of the path: its bound when it was entered, the
+            # smallest bound of its children so far, and whether one was cut
+            bounds = [threshold]
+            child_bounds = [unreachable]
+            cuts = [False]
+            expanded += 1
+
+            while iterators:
+                move = next(iterators[-1], None)
+                if move is None:
+                    # every child is bounded: learn the board's bound
+                    iterators.pop()
+                    code = path.pop()
+                    on_path.discard(code)
+                    bound = max(bounds.pop(), child_bounds.pop())
+                    cut = cuts.pop()
+                    if not path:
+                        break
+                    if code in table or len(table) < table_size:
+                        table[code] = bound << 1 | cut
+                    if bound + 1 < child_bounds[-1]:
+                        child_bounds[-1] = bound + 1
+                    if cut:
+                        cuts[-1] = True
+                    continue
+                generated += 1
+                child = move[0]
+                if child in on_path:
+                    # a cycle, covered by the search of the board on the path
+                    duplicates += 1
+                    continue
+                entry = table.get(child)
+                bound = heuristic(child) if entry is None else entry >> 1
+                depth = len(path)
+                if depth + bound > threshold:
+                    if entry is not None:
+                        duplicates += 1
+                    if bound + 1 < child_bounds[-1]:
+                        child_bounds[-1] = bound + 1
+                    if entry is None or entry & 1:
+                        cuts[-1] = True
+                    continue
+                if is_goal(child):
+                    return chain_states(initial_state, path[1:] + [child])
+                path.append(child)
+                on_path.add(child)
+                iterators.append(generate(child))
+                bounds.append(bound)
+                child_bounds.append(unreachable)
+                cuts.append(False)
+                expanded += 1
+                if expanded >= interval:
+                    stats.report(expanded, generated, duplicates, len(path), len(table))
+                    expanded = generated = duplicates = 0
+                    interval = stats.check()
+
+            # without a cut the search saw every board it can reach
+            if not cut:
+                return None
+            # the whole tree under the threshold has been searched
+            threshold = max(threshold + 1, bound)
+    except BudgetExceeded as exceeded:
+        # only the current path is known; stop it at its most promising board
+        best = min(range(len(path)), key=lambda depth: heuristic(path[depth]))
+        exceeded.best = chain_states(initial_state, path[1:best + 1])
+        raise
+    finally:
+        stats.report(expanded, generated, duplicates, len(path), len(table))
+
+
+# ====================================================================================
+# Bidirectional search.
+#
+# Moves are reversible, so the goal side can be searched with the same move
+# generator. The goal test only fixes the 2x2 piece, so the backward search starts
+# from every goal board with the same pieces as the initial board.
+
+
+def piece_counts(code):
+    """
+    :param code: The encoded board, of any size.
+    :type code: int
+    :return: The number of 1x1, vertical 1x2 and horizontal 1x2 pieces.
+    :rtype: Tuple[int, int, int]
+    """
+    singles = verticals = horizontals = 0
+    while code:
+        value = code & 7
+        code >>= 3
+        if value == CELL_SINGLE:
+            singles += 1
+        elif value == CELL_UP:
+            verticals += 1
+        elif value == CELL_LEFT:
+            horizontals += 1
+    return singles, verticals, horizontals
+
+
+def goal_boards(counts, geometry=None):
+    """
+    Enumerate every goal board made of the given pieces.
+
+    :param counts: The number of 1x1, vertical 1x2 and horizontal 1x2 pieces.
+    :type counts: Tuple[int, int, int]
+    :param geometry: The size and goal of the board, or None for the
+        classic 5x4 board.
+    :type geometry: Optional[Geometry]
+    :return: The encoded goal boards.
+    :rtype: List[int]
+    """
+    return list(iter_goal_boards(counts, geometry))
+
+
+def iter_goal_boards(counts, geometry=None):
+    """
+    Enumerate every goal board made of the given pieces, one at a time. There
+    are millions of them on larger boards.
+
+    :param counts: The number of 1x1, vertical 1x2 and horizontal 1x2 pieces.
+    :type counts: Tuple[int, int, int]
+    :param geometry: The size and goal of the board, or None for the
+        classic 5x4 board.
+    :type geometry: Optional[Geometry]
+    :return: The encoded goal boards.
+    :rtype: Iterator[int]
+    """
+    if geometry is None:
+        geometry = classic
+    width, cells = geometry.width, geometry.cells
+    # shift of the cell below
+    below = 3 * width
+    singles, verticals, horizontals = counts
+    empties = cells - 4 - singles - 2 * (verticals + horizontals)
+    if empties < 0:
+        return
+    head = geometry.goal_cell
+    goal = CELL_GOAL << (3 * head)
+    for cell in (head + 1, head + width, head + width + 1):
+        goal |= CELL_GOAL_BODY << (3 * cell)
+
+    def place(cell, code, singles, verticals, horizontals, empties):
+        while cell < cells and (code >> (3 * cell)) & 7:
+            cell += 1
+        if cell == cells:
+            yield code
+            return
+        row, col = divmod(cell, width)
+        shift = 3 * cell
+        if empties:
+            # leave this cell empty
+            yield from place(cell + 1, code, singles, verticals, horizontals, empties - 1)
+        if singles:
+            yield from place(cell + 1, code | CELL_SINGLE << shift,
+                             singles - 1, verticals, horizontals, empties)
+        if verticals and row < geometry.height - 1 and not (code >> (shift + below)) & 7:
+            yield from place(cell + 1, code | CELL_UP << shift | CELL_DOWN << (shift + below),
+                             singles, verticals - 1, horizontals, empties)
+        if horizontals and col < width - 1 and not (code >> (shift + 3)) & 7:
+            yield from place(cell + 1, code | CELL_LEFT << shift | CELL_RIGHT << (shift + 3),
+                             singles, verticals, horizontals - 1, empties)
+
+    yield from place(0, goal, singles, verticals, horizontals, empties)
+
+
+def bidirectional(initial_state, stats=None, moves=None):
+    """
+    Breadth-first search from the initial board and from all goal boards at
+    once, expanding whichever frontier is smaller one full layer at a time.
+    The returned path is a shortest one.
+
+    :param initial_state: The state to search from.
+    :type initial_state: State
+    :param stats: The instrumentation to report to, or None.
+    :type stats: Optional[SearchStats]
+    :param moves: The move generator of the move metric, one of the
+        geometry's metrics, or None for the step metric with moves
+        generated from the empty cells.
+    :type moves: Optional[Callable[[int], Iterator[Tuple[int, int, str]]]]
+    :return: The goal state, or None if no goal is reachable.
+    :rtype: Optional[State]
+    """
+    geometry = initial_state.board.geometry
+    if moves is None:
+        moves = geometry.blank_successors
+    start = encode_board(initial_state.board)
+    if geometry.is_goal(start):
+        return initial_state
+    # code -> (parent code, depth) for each side
+    forward = {start: (None, 0)}
+    backward = {}
+    forward_frontier = [start]
+    backward_frontier = []
+    if stats is None:
+        stats = SearchStats()
+    generate = stats.timed('generate', moves, True)
+    # boards are added to the sides as they are generated, so their limit is checked there
+    max_visited = stats.max_visited if stats.max_visited is not None else float('inf')
+    expanded = generated = duplicates = 0
+
+    try:
+        interval = stats.check()
+        # the goal boards are seeded under the same limits: larger boards have
+        # millions of them
+        for goal in iter_goal_boards(piece_counts(start), geometry):
+            backward[goal] = (None, 0)
+            backward_frontier.append(goal)
+            if len(forward) + len(backward) >= max_visited:
+                raise BudgetExceeded('visited-limit')
+            if len(backward) % stats.time_check_interval == 0:
+                stats.check()
+        while forward_frontier and backward_frontier:
+            forward_turn = len(forward_frontier) <= len(backward_frontier)
+            if forward_turn:
+                frontier, seen, other = forward_frontier, forward, backward
+            else:
+                frontier, seen, other = backward_frontier, backward, forward
+            depth = seen[frontier[0]][1] + 1
+            next_frontier = []
+            best = None
+            for code in frontier:
+                expanded += 1
+                if expanded >= interval:
+                    stats.report(expanded, generated, duplicates,
+                                 len(frontier) + len(next_frontier), len(forward) + len(backward))
+                    expanded = generated = duplicates = 0
+                    interval = stats.check()
+                for child, cell, direction in generate(code):
+                    generated += 1
+                    if child in seen:
+                        duplicates += 1
+                        continue
+                    seen[child] = (code, depth)
+                    if len(forward) + len(backward) >= max_visited:
+                        raise BudgetExceeded('visited-limit')
+                    next_frontier.append(child)
+                    if child in other:
+                        length = depth + other[child][1]
+                        if best is None or length < best[0]:
+                            best = (length, child)
+            if best is not None:
+                meet = best[1]
+                path = []
+                code = meet
+                while code is not None:
+                    path.append(code)
+                    code = forward[code][0]
+                path.reverse()
+                code = backward[meet][0]
+                while code is not None:
+                    path.append(code)
+                    code = backward[code][0]
+                return chain_states(initial_state, path[1:])
+            if forward_turn:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+    except BudgetExceeded as exceeded:
+        path = []
+        code = min(forward, key=geometry.heuristics['manhattan'])
+        while code is not None:
+            path.append(code)
+            code = forward[code][0]
+        path.reverse()
+        exceeded.best = chain_states(initial_state, path[1:])
+        raise
+    finally:
+        stats.report(expanded, generated, duplicates,
+                     len(forward_frontier) + len(backward_frontier), len(forward) + len(backward))
+
+
+# ====================================================================================
+# Distance database.
+#
+# For a fixed set of pieces the reachable boards form a small graph, so the exact
+# distance of every board to the nearest goal can be computed once with a
+# breadth-first search backwards from all goal boards and saved. Databases cover the
+# classic 5x4 board only, whose codes fit in 64 bits. The file holds a
+# 16-byte header (magic, distance width, count), the sorted codes as little-endian
+# uint64 and then the distances, so it can be memory-mapped and binary-searched
+# without loading it.
+
+db_magic = b'HRDB'
+
+
+def build_distance_table(counts):
+    """
+    Compute the distance to the nearest goal of every board that can reach a
+    goal, for boards made of the given pieces.
+
+    :param counts: The number of 1x1, vertical 1x2 and horizontal 1x2 pieces.
+    :type counts: Tuple[int, int, int]
+    :return: Encoded board -> number of moves to the nearest goal.
+    :rtype: Dict[int, int]
+    """
+    frontier = goal_boards(counts)
+    distances = dict.fromkeys(frontier, 0)
+    depth = 0
+    while frontier:
+        depth += 1
+        next_frontier = []
+        for code in frontier:
+            for child, cell, direction in successors(code):
+                if child not in distances:
+                    distances[child] = depth
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return distances
+
+
+def write_distance_db(filename, distances):
+    """
+    Save a distance table in the memory-mappable database format.
+
+    :param filename: The database file to write.
+    :type filename: str
+    :param distances: Encoded board -> distance, as from build_distance_table.
+    :type distances: Dict[int, int]
+    """
+    codes = array('Q', sorted(distances))
+    width = 1 if max(distances.values(), default=0) < 256 else 2
+    values = array('B' if width == 1 else 'H', [distances[code] for code in codes])
+    if sys.byteorder != 'little':
+        codes.byteswap()
+        values.byteswap()
+    with open(filename, 'wb') as db_file:
+        db_file.write(db_magic + struct.pack('<IQ', width, len(codes)))
+        db_file.write(codes.tobytes())
+        db_file.write(values.tobytes())
+
+
+class DistanceDatabase:
+    """
+    Read-only, memory-mapped view of a database written by write_distance_db.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: The database file to open.
+        :type filename: str
+        """
+        with open(filename, 'rb') as db_file:
+            self.__map = mmap.mmap(db_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.__map[:4] != db_magic:
+            self.__map.close()
+            raise ValueError('{} is not a distance database'.format(filename))
+        width, self.count = struct.unpack_from('<IQ', self.__map, 4)
+        if sys.byteorder != 'little':
+            self.__map.close()
+            raise ValueError('distance databases can only be mapped on little-endian machines')
+        view = memoryview(self.__map)
+        codes_end = 16 + 8 * self.count
+        self.__codes = view[16:codes_end].cast('Q')
+        self.__distances = view[codes_end:codes_end + width * self.count].cast('B' if width == 1 else 'H')
+        view.release()
+
+    def get(self, code, default=None):
+        """
+        :param code: The encoded board.
+        :type code: int
+        :return: The board's distance to the nearest goal, or default if the
+            board is not in the database.
+        :rtype: Optional[int]
+        """
+        index = bisect_left(self.__codes, code)
+        if index < self.count and self.__codes[index] == code:
+            return self.__distances[index]
+        return default
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def counts(self):
+        """
+        The piece counts of the boards in the database, as returned by
+        piece_counts, or None for an empty database.
+        """
+        return piece_counts(self.__codes[0]) if self.count else None
+
+    def close(self):
+        self.__codes.release()
+        self.__distances.release()
+        self.__map.close()
+
+
+def lookup(initial_state, database, stats=None):
+    """
+    Solve a board by always moving to a neighbour one step closer to a goal
+    according to a distance database. The returned path is optimal.
+
+    :param initial_state: The state to search from.
+    :type initial_state: State
+    :param database: A database built for the board's set of pieces.
+    :type database: DistanceDatabase
+    :param stats: The instrumentation to report to, or None.
+    :type stats: Optional[SearchStats]
+    :return: The goal state, or None if the board is not in the database.
+    :rtype: Optional[State]
+    :raises ValueError: If the database was built for other pieces.
+    """
+    if initial_state.board.geometry is not classic:
+        raise ValueError('distance databases only cover the classic 5x4 board')
+    code = encode_board(initial_state.board)
+    if database.counts != piece_counts(code):
+        raise ValueError("database does not cover this board's pieces")
+    if stats is None:
+        stats = SearchStats()
+    generate = stats.timed('generate', successors, True)
+    get = stats.timed('hash', database.get)
+    distance = get(code)
+    if distance is None:
+        return None
+    path = []
+    expanded = generated = 0
+    try:
+        while distance:
+            expanded += 1
+            for child, cell, direction in generate(code):
+                generated += 1
+                if get(child) == distance - 1:
+                    code = child
+                    break
+            else:
+                raise ValueError('distance database is inconsistent with the board')
+            distance -= 1
+            path.append(code)
+    finally:
+        stats.report(expanded, generated, 0, 0, 0)
+    return chain_states(initial_state, path)
+
+
+# ====================================================================================
+# Pattern databases.
+#
+# A pattern database is the distance database of an abstraction of the board: only
+# the 2x2 piece and the pieces of some kinds are kept, the others are taken off.
+# Every move of a kept piece is still legal without the others in the way, and the
+# others move for free, so the distance of the abstract board is a lower bound of
+# the real one, and a consistent heuristic. Pattern databases all keep the 2x2
+# piece, so they are combined with max rather than added. They are written in the
+# distance database format, the kinds kept being those whose pieces they hold, and
+# are opened on first use and memory-mapped, so a search only reads the pages it
+# touches. Like distance databases, they cover the classic 5x4 board only.
+
+# The kinds of pieces a pattern can keep besides the 2x2 piece, in the order of
+# piece_counts, with the cell codes of each.
+piece_kinds = OrderedDict([
+    ('singles', (CELL_SINGLE,)),
+    ('verticals', (CELL_UP, CELL_DOWN)),
+    ('horizontals', (CELL_LEFT, CELL_RIGHT)),
+])
+
+# The heuristic of a board whose abstraction cannot reach a goal, so that neither
+# can the board.
+unreachable = 1 << 16
+
+# Pattern databases opened so far, by filename.
+_pattern_databases = {}
+
+
+def pattern_counts(counts, kinds):
+    """
+    :param counts: The number of 1x1, vertical 1x2 and horizontal 1x2 pieces.
+    :type counts: Tuple[int, int, int]
+    :param kinds: The names of the kinds kept, from piece_kinds.
+    :type kinds: Iterable[str]
+    :return: The counts of the abstract boards keeping those kinds.
+    :rtype: Tuple[int, int, int]
+    """
+    kinds = set(kinds)
+    return tuple(count if kind in kinds else 0 for kind, count in zip(piece_kinds, counts))
+
+
+def build_pattern_table(counts, kinds):
+    """
+    Compute the distance to the nearest goal of every abstract board keeping
+    the given kinds of pieces.
+
+    :param counts: The number of 1x1, vertical 1x2 and horizontal 1x2 pieces
+        of the real boards.
+    :type counts: Tuple[int, int, int]
+    :param kinds: The names of the kinds kept, from piece_kinds.
+    :type kinds: Iterable[str]
+    :return: Encoded abstract board -> number of moves to the nearest goal.
+    :rtype: Dict[int, int]
+    """
+    return build_distance_table(pattern_counts(counts, kinds))
+
+
+def _build_projection_table(values):
+    """
+    :param values: The cell codes kept.
+    :type values: Set[int]
+    :return: For every row of an encoded board, the row with every other
+        cell emptied.
+    :rtype: List[int]
+    """
+    table = []
+    for row in range(1 << 12):
+        projected = 0
+        for col in range(4):
+            value = (row >> (3 * col)) & 7
+            if value in values:
+                projected |= value << (3 * col)
+        table.append(projected)
+    return table
+
+
+def pattern_database(filename):
+    """
+    :param filename: A database written by write_distance_db from
+        build_pattern_table.
+    :type filename: str
+    :return: The database, opened on the first call for the file and shared
+        afterwards.
+    :rtype: DistanceDatabase
+    """
+    database = _pattern_databases.get(filename)
+    if database is None:
+        database = _pattern_databases[filename] = DistanceDatabase(filename)
+    return database
+
+
+def pattern_heuristic(databases, counts, base=manhattan_heuristic):
+    """
+    Combine a heuristic with pattern databases by max.
+
+    :param databases: The pattern databases. Those not built for boards with
+        the given pieces are left out.
+    :type databases: Iterable[DistanceDatabase]
+    :param counts: The piece counts of the boards searched, as returned by
+        piece_counts.
+    :type counts: Tuple[int, int, int]
+    :param base: The heuristic combined with the databases.
+    :type base: Callable[[int], int]
+    :return: A heuristic for classic boards with those pieces.
+    :rtype: Callable[[int], int]
+    """
+    lookups = []
+    for database in databases:
+        kinds = [kind for kind, count in zip(piece_kinds, database.counts or ()) if count]
+        if database.counts != pattern_counts(counts, kinds):
+            continue
+        values = {CELL_GOAL, CELL_GOAL_BODY}
+        for kind in kinds:
+            values.update(piece_kinds[kind])
+        lookups.append((_build_projection_table(values), database.get))
+
+    def heuristic(code):
+        """
+        :param code: The encoded board.
+        :type code: int
+        :return: The largest of the base heuristic and the distances of the
+            board's abstractions, or unreachable.
+        :rtype: int
+        """
+        value = base(code)
+        for table, get in lookups:
+            distance = get(table[code & 0xFFF]
+                           | table[(code >> 12) & 0xFFF] << 12
+                           | table[(code >> 24) & 0xFFF] << 24
+                           | table[(code >> 36) & 0xFFF] << 36
+                           | table[(code >> 48) & 0xFFF] << 48)
+            if distance is None:
+                return unreachable
+            if distance > value:
+                value = distance
+        return value
+    return heuristic
+
+
+# ====================================================================================
+# Pre-checks.
+#
+# read_from_lines already rejects malformed boards. precheck catches well-formed
+# boards that cannot be solved before a search spends its time on them.
+
+
+def empty_cells(code, geometry=None):
+    """
+    :param code: The encoded board.
+    :type code: int
+    :param geometry: The size and goal of the board, or None for the
+        classic 5x4 board.
+    :type geometry: Optional[Geometry]
+    :return: The number of empty cells.
+    :rtype: int
+    """
+    cells = (classic if geometry is None else geometry).cells
+    return sum(1 for cell in range(cells) if (code >> (3 * cell)) & 7 == CELL_EMPTY)
+
+
+def precheck(code, database=None, geometry=None):
+    """
+    Prove a board unsolvable without searching it, where that is cheap.
+
+    :param code: The encoded board.
+    :type code: int
+    :param database: A distance database; it decides classic boards with its
+        pieces exactly and is ignored for other boards.
+    :type database: Optional[DistanceDatabase]
+    :param geometry: The size and goal of the board, or None for the
+        classic 5x4 board.
+    :type geometry: Optional[Geometry]
+    :return: Why the board cannot be solved, or None if it may be solvable.
+    :rtype: Optional[str]
+    """
+    if geometry is None:
+        geometry = classic
+    if geometry.is_goal(code):
+        return None
+    if empty_cells(code, geometry) < 2:
+        return 'fewer than two empty cells, so the 2x2 piece can never move'
+    if geometry is not classic:
+        database = None
+    if database is not None and database.counts == piece_counts(code) and code not in database:
+        return 'no goal board is reachable, according to the distance database'
+    return None
+
+
+# ====================================================================================
+# Solution cache.
+#
+# Every board on an optimal path has an optimal continuation: the rest of that
+# path. The cache keeps, for each board of every stored path, the next board and
+# the number of moves left, so any suffix of a solved path is a hit and is read
+# back by walking the next boards. Boards are keyed by canonical encoding, so a
+# board and its mirror image share their entries. Only classic 5x4 boards are
+# cached.
+
+
+class SolutionCache:
+    """
+    Optimal continuations of solved boards, in memory with LRU eviction and,
+    given a filename, also in an SQLite database that outlives the process.
+    Safe to share between threads.
+    """
+
+    def __init__(self, capacity=1 << 20, filename=None):
+        """
+        :param capacity: The most boards kept in memory.
+        :type capacity: int
+        :param filename: The SQLite database backing the cache, or None.
+        :type filename: Optional[str]
+        """
+        self.capacity = capacity
+        # canonical code -> (next board in the canonical frame, moves left)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.connection = None
+        if filename is not None:
+            self.connection = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS boards (code INTEGER PRIMARY KEY, '
+                                    'next INTEGER NOT NULL, moves INTEGER NOT NULL)')
+            self.connection.commit()
+
+    def _entry(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+        if self.connection is None:
+            return None
+        row = self.connection.execute('SELECT next, moves FROM boards WHERE code = ?',
+                                      (key,)).fetchone()
+        if row is None:
+            return None
+        entry = self.entries[key] = tuple(row)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return entry
+
+    def get(self, code):
+        """
+        :param code: The encoded board.
+        :type code: int
+        :return: The encoded boards of an optimal path from code to a goal, or
+            None if the board is not cached.
+        :rtype: Optional[List[int]]
+        """
+        with self.lock:
+            path = [code]
+            key = canonical_code(code)
+            entry = self._entry(key)
+            if entry is not None:
+                for moves in range(entry[1], 0, -1):
+                    if entry is None or entry[1] != moves:
+                        # evicted, or left over from a corrupt store
+                        break
+                    code = entry[0] if key == code else mirror_code(entry[0])
+                    path.append(code)
+                    key = canonical_code(code)
+                    entry = self._entry(key)
+                else:
+                    self.hits += 1
+                    return path
+            self.misses += 1
+            return None
+
+    def put(self, path):
+        """
+        Store an optimal path and with it all of its suffixes.
+
+        :param path: The encoded boards from a board to a goal.
+        :type path: List[int]
+        """
+        rows = []
+        moves = len(path) - 1
+        with self.lock:
+            for index, code in enumerate(path):
+                next_code = path[index + 1] if index < moves else code
+                key = canonical_code(code)
+                if key != code:
+                    next_code = mirror_code(next_code)
+                if key not in self.entries:
+                    self.entries[key] = (next_code, moves - index)
+                    rows.append((key, next_code, moves - index))
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            if self.connection is not None and rows:
+                # optimal continuations of the same board have the same length,
+                # so boards already stored are left alone
+                self.connection.executemany('INSERT OR IGNORE INTO boards VALUES (?, ?, ?)', rows)
+                self.connection.commit()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+# ====================================================================================
+# Library API.
+#
+# solve() runs a search on its own visited set and returns a Solution, so it can
+# be called from several threads or requests at once; writing the result out is
+# left to the writers below.
+
+algorithms = ['astar', 'dfs', 'bidir', 'idastar', 'lookup']
+
+# The algorithms whose paths are optimal, and so may be cached.
+optimal_algorithms = {'astar', 'bidir', 'idastar', 'lookup'}
+
+Move = namedtuple('Move', ['piece', 'row', 'col', 'direction', 'distance'], defaults=(1,))
+Move.__doc__ = """
+A move of the piece whose top-left cell is at (row, col) by distance cells in
+direction. A slide that turns corners names the direction of each straight run,
+joined by '-', such as 'down-right'.
+"""
+
+
+def path_moves(path, geometry=None):
+    """
+    :param path: Encoded boards, each one move away from the one before, in
+        either move metric.
+    :type path: List[int]
+    :param geometry: The size and goal of the boards, or None for the
+        classic 5x4 board.
+    :type geometry: Optional[Geometry]
+    :return: The moves leading from each board to the next.
+    :rtype: List[Move]
+    """
+    if geometry is None:
+        geometry = classic
+    moves = []
+    for code, next_code in zip(path, path[1:]):
+        for child, cell, direction in geometry.successors(code):
+            if child == next_code:
+                row, col = divmod(cell, geometry.width)
+                moves.append(Move(cell_chars[(code >> (3 * cell)) & 7], row, col, direction))
+                break
+        else:
+            for child, cell, steps in geometry.slides(code):
+                if child == next_code:
+                    row, col = divmod(cell, geometry.width)
+                    runs = [steps[0]] + [step for previous, step in zip(steps, steps[1:])
+                                         if step != previous]
+                    moves.append(Move(cell_chars[(code >> (3 * cell)) & 7], row, col,
+                                      '-'.join(runs), len(steps)))
+                    break
+            else:
+                raise ValueError('boards are not one move apart')
+    return moves
+
+
+class Solution:
+    """
+    The outcome of solve(): the path found, if any, and how it was found.
+    """
+
+    def __init__(self, algo, path, stats, status=None, best=None, geometry=None):
+        """
+        :param algo: The searching algorithm that was used.
+        :type algo: str
+        :param path: The encoded boards from the initial board to a goal, or
+            an empty list if no solution was found.
+        :type path: List[int]
+        :param stats: Search statistics: the SearchStats counters and the
+            time taken in seconds.
+        :type stats: Dict[str, Any]
+        :param status: 'solved', 'exhausted' if the search ended without a
+            solution, 'unsolvable' if precheck rejected the board, or the
+            reason of BudgetExceeded if it was stopped. None picks 'solved' or
+            'exhausted' from the path.
+        :type status: Optional[str]
+        :param best: For a stopped search, the encoded boards from the initial
+            board to the most promising board it reached.
+        :type best: Optional[List[int]]
+        :param geometry: The size and goal of the board, or None for the
+            classic 5x4 board.
+        :type geometry: Optional[Geometry]
+        """
+        self.algo = algo
+        self.path = path
+        self.stats = stats
+        self.geometry = classic if geometry is None else geometry
+        self.moves = path_moves(path, self.geometry)
+        if status is None:
+            status = 'solved' if path else 'exhausted'
+        self.status = status
+        self.best = best if best is not None else []
+
+    @property
+    def solved(self):
+        return bool(self.path)
+
+    @property
+    def length(self):
+        """
+        The number of moves in the solution.
+        """
+        return len(self.moves)
+
+    def boards(self):
+        """
+        :return: The boards along the path.
+        :rtype: List[Board]
+        """
+        return [decode_board(code, self.geometry) for code in self.path]
+
+    def __repr__(self):
+        return 'Solution({}, status={}, length={})'.format(self.algo, self.status, self.length)
+
+
+def state_path(state):
+    """
+    :param state: The last state of a chain, or None.
+    :type state: Optional[State]
+    :return: The encoded boards from the first state of the chain to state.
+    :rtype: List[int]
+    """
+    path = []
+    while state is not None:
+        path.append(encode_board(state.board))
+        state = state.parent
+    path.reverse()
+    return path
+
+
+def solve(board, algo='astar', heuristic='manhattan', symmetric=False, database=None,
+          table_size=1 << 20, tie_break='deep', open_list='heap', stats=None, max_time=None,
+          max_expanded=None, max_visited=None, check=True, cache=None, metric='step',
+          patterns=None):
+    """
+    Solve a board.
+
+    :param board: The board to solve, or its encoding on the classic board.
+    :type board: Union[Board, int]
+    :param algo: One of the names in algorithms.
+    :type algo: str
+    :param heuristic: The heuristic used by astar and idastar, or the name of
+        one of the board's geometry.
+    :type heuristic: Union[Callable[[int], int], str]
+    :param symmetric: Merge mirror images in the visited set (dfs and astar).
+    :type symmetric: bool
+    :param database: The distance database used by lookup, for classic boards.
+    :type database: Optional[DistanceDatabase]
+    :param table_size: The most boards idastar keeps in its transposition table.
+    :type table_size: int
+    :param tie_break: How astar orders nodes with equal f, one of tie_breaks.
+    :type tie_break: str
+    :param open_list: The open list used by astar, one of open_lists.
+    :type open_list: str
+    :param stats: The instrumentation the search reports to, for progress
+        callbacks and phase timers, or None for a plain one.
+    :type stats: Optional[SearchStats]
+    :param max_time: Stop the search after this many seconds, or None.
+    :type max_time: Optional[float]
+    :param max_expanded: Stop the search after this many expansions, or None.
+    :type max_expanded: Optional[int]
+    :param max_visited: Stop the search once its visited set holds this many
+        boards, or None.
+    :type max_visited: Optional[int]
+    :param check: Run precheck, with the database if given, and return an
+        'unsolvable' solution without searching if it rejects the board. The
+        reason is in solution.stats['reason'].
+    :type check: bool
+    :param cache: A cache of optimal paths. For the algorithms in
+        optimal_algorithms a cached board is answered without searching, with
+        solution.stats['cached'] set, and solved boards are added to it. It
+        is not used for boards other than the classic 5x4 board.
+    :type cache: Optional[SolutionCache]
+    :param metric: How moves are counted, one of metrics: 'step' moves a piece
+        by one cell, 'slide' by any distance. A heuristic given by name is
+        taken from slide_heuristics for 'slide'. lookup and the cache only
+        know the step metric.
+    :type metric: str
+    :param patterns: Pattern database files; astar and idastar combine their
+        distances with the heuristic by max, for classic boards and the step
+        metric. They are opened when a search first needs them.
+    :type patterns: Optional[List[str]]
+    :return: The solution; solution.solved is False if there is none, and
+        solution.status tells whether the search ran out or was stopped.
+    :rtype: Solution
+    """
+    if isinstance(board, int):
+        board = decode_board(board)
+    geometry = board.geometry
+    if isinstance(heuristic, str):
+        heuristic = (geometry.slide_heuristics if metric == 'slide'
+                     else geometry.heuristics)[heuristic]
+    moves = geometry.metrics[metric]
+    if metric == 'step':
+        # each search picks its own generator of single steps
+        moves = None
+    if geometry is not classic:
+        cache = None
+    if metric != 'step':
+        if algo == 'lookup':
+            raise ValueError('lookup only knows the step metric')
+        cache = None
+    start = time.perf_counter()
+    search_stats = stats if stats is not None else SearchStats()
+    if cache is not None and algo in optimal_algorithms:
+        path = cache.get(encode_board(board))
+        if path is not None:
+            result_stats = search_stats.as_dict()
+            result_stats['time'] = time.perf_counter() - start
+            result_stats['cached'] = True
+            return Solution(algo, path, result_stats, geometry=geometry)
+    if check:
+        reason = precheck(encode_board(board), database, geometry)
+        if reason is not None:
+            result_stats = search_stats.as_dict()
+            result_stats['time'] = time.perf_counter() - start
+            result_stats['reason'] = reason
+            return Solution(algo, [], result_stats, 'unsolvable', geometry=geometry)
+    if max_time is not None:
+        # the time limit counts from here, not from the creation of stats
+        search_stats.max_time = max_time + (start - search_stats.start)
+    if max_expanded is not None:
+        search_stats.max_expanded = max_expanded
+    if max_visited is not None:
+        search_stats.max_visited = max_visited
+    if patterns and algo in ('astar', 'idastar') and metric == 'step' and geometry is classic:
+        databases = [pattern_database(filename) for filename in patterns]
+        heuristic = pattern_heuristic(databases, piece_counts(encode_board(board)), heuristic)
+    first_state = State(board, 0, 0, None)
+    status = best = None
+    try:
+        if algo == 'dfs':
+            last_state = dfs(first_state, symmetric, None, search_stats, moves)
+        elif algo == 'astar':
+            last_state = astar(first_state, heuristic, symmetric, None, tie_break, open_list,
+                               search_stats, moves)
+        elif algo == 'bidir':
+            last_state = bidirectional(first_state, search_stats, moves)
+        elif algo == 'idastar':
+            last_state = idastar(first_state, heuristic, table_size, search_stats, moves)
+        elif algo == 'lookup':
+            if database is None:
+                raise ValueError('lookup needs a distance database')
+            last_state = lookup(first_state, database, search_stats)
+        else:
+            raise ValueError('unknown algorithm {}'.format(algo))
+    except BudgetExceeded as exceeded:
+        status = exceeded.reason
+        best = state_path(exceeded.best)
+        last_state = None
+    path = state_path(last_state)
+    if cache is not None and path and algo in optimal_algorithms:
+        cache.put(path)
+    result_stats = search_stats.as_dict()
+    result_stats['time'] = time.perf_counter() - start
+    return Solution(algo, path, result_stats, status, best, geometry)
+
+
+# ====================================================================================
+# Output.
+#
+# Writers build the whole text of a solution first and hand it to the stream in
+# a single write. A solution can be written as the grid of every board on its path,
+# which is how the solver has always printed it, as a list of moves, which takes
+# less than half the space, or as one line of JSON.
+
+
+def code_rows(code, geometry=None):
+    """
+    :param code: The encoded board.
+    :type code: int
+    :param geometry: The size and goal of the board, or None for the
+        classic 5x4 board.
+    :type geometry: Optional[Geometry]
+    :return: The rows of the board as strings.
+    :rtype: List[str]
+    """
+    if geometry is None:
+        geometry = classic
+    width = geometry.width
+    cells = ''.join([cell_chars[(code >> (3 * cell)) & 7] for cell in range(geometry.cells)])
+    return [cells[start:start + width] for start in range(0, geometry.cells, width)]
+
+
+def format_grid_path(path, geometry=None):
+    """
+    Format a path the way the solver has always printed it: the number of
+    boards, then every board as a grid followed by two blank lines.
+
+    :param path: The encoded boards along the path.
+    :type path: List[int]
+    :param geometry: The size and goal of the boards, or None for the
+        classic 5x4 board.
+    :type geometry: Optional[Geometry]
+    :rtype: str
+    """
+    parts = [str(len(path)), '\n']
+    for code in path:
+        for row in code_rows(code, geometry):
+            parts.append(row)
+            parts.append('\n')
+        parts.append('\n\n')
+    return ''.join(parts)
+
+
+def format_move(move):
+    """
+    :param move: A move of a solution.
+    :type move: Move
+    :return: The piece, the row and column of its top-left cell, the direction
+        and the distance, separated by spaces, such as '^ 0 0 down 1'.
+    :rtype: str
+    """
+    return '{} {} {} {} {}'.format(move.piece, move.row, move.col, move.direction, move.distance)
+
+
+def format_grid(solution):
+    """
+    :param solution: The solution to format.
+    :type solution: Solution
+    :return: The number of boards, then every board as a grid followed by two
+        blank lines.
+    :rtype: str
+    """
+    return format_grid_path(solution.path, solution.geometry)
+
+
+def format_moves(solution):
+    """
+    :param solution: The solution to format.
+    :type solution: Solution
+    :return: The number of moves, then one move per line as by format_move.
+    :rtype: str
+    """
+    parts = [str(solution.length), '\n']
+    for move in solution.moves:
+        parts.append(format_move(move))
+        parts.append('\n')
+    return ''.join(parts)
+
+
+def format_json(solution):
+    """
+    :param solution: The solution to format.
+    :type solution: Solution
+    :return: One line of JSON with the algorithm, the status, the initial
+        board's rows, the moves as [piece, row, col, direction, distance] and
+        the search statistics.
+    :rtype: str
+    """
+    first = solution.path or solution.best
+    record = {'algo': solution.algo, 'status': solution.status, 'length': solution.length,
+              'board': code_rows(first[0], solution.geometry) if first else None,
+              'moves': [list(move) for move in solution.moves], 'stats': solution.stats}
+    return json.dumps(record) + '\n'
+
+
+# The output formats of write_solution, by name.
+output_formats = {
+    'grid': format_grid,
+    'moves': format_moves,
+    'json': format_json,
+}
+
+
+def format_stats(stats, elapsed):
+    """
+    :param stats: The instrumentation of a search.
+    :type stats: SearchStats
+    :param elapsed: Seconds the search has been running.
+    :type elapsed: float
+    :return: The counters and phase times, on one line.
+    :rtype: str
+    """
+    text = '{:.2f}s expanded={} generated={} duplicates={} open={} peak_open={} ' \
+           'peak_visited={}'.format(elapsed, stats.expanded, stats.generated, stats.duplicates,
+                                    stats.open_size, stats.peak_open, stats.peak_visited)
+    if stats.phases:
+        phases = ' '.join('{}={:.2f}s'.format(phase, seconds)
+                          for phase, seconds in sorted(stats.phases.items()))
+        text += ' ' + phases + ' other={:.2f}s'.format(elapsed - sum(stats.phases.values()))
+    return text
+
+
+def write_solution(solution, out, format='grid'):
+    """
+    Write a solution with a single write.
+
+    :param solution: The solution to write.
+    :type solution: Solution
+    :param out: The stream to write to.
+    :type out: TextIO
+    :param format: One of output_formats.
+    :type format: str
+    """
+    out.write(output_formats[format](solution))
+
+
+# ====================================================================================
+# Reading many puzzles.
+#
+# A corpus of puzzles is read straight into encoded boards. The pieces of a board
+# are checked with a few bitwise operations on its code rather than by building
+# Pieces and a Board, and read_from_lines is only run on a bad board, to describe
+# the problem. A file holds boards separated by blank lines, or one board per line
+# with its rows separated by '/'.
+
+# Bytes to the octal digits of _encode_table, and every other byte to 'x' so that a
+# bad character makes int() fail.
+_encode_bytes = bytes(ord(_encode_table.get(byte, 'x')) for byte in range(256))
+
+
+def encode_rows(rows, goal=None):
+    """
+    Encode the rows of a puzzle, checking that they form a valid board.
+
+    :param rows: The rows of the puzzle, top to bottom.
+    :type rows: List[str]
+    :param goal: The (row, col) the top-left cell of the 2x2 piece has to
+        reach, or None for the middle of the two bottom rows.
+    :type goal: Optional[Tuple[int, int]]
+    :return: The encoded board and its geometry.
+    :rtype: Tuple[int, Geometry]
+    :raises InvalidBoard: If the rows are not a valid board, as for
+        read_from_lines.
+    """
+    height = len(rows)
+    width = len(rows[0]) if rows else 0
+    flat = ''.join(rows).encode('ascii', 'replace')
+    try:
+        code = int(flat[::-1].translate(_encode_bytes), 8)
+    except ValueError:
+        code = None
+    if code is not None and width >= 2 and height >= 2 and len(flat) == width * height \
+            and all(len(row) == width for row in rows):
+        try:
+            geometry = get_geometry(width, height, goal)
+        except ValueError as error:
+            raise InvalidBoard(str(error)) from None
+        head = flat.find(char_goal.encode())
+        if head >= 0:
+            code ^= (CELL_GOAL ^ CELL_GOAL_BODY) << (3 * head)
+        low_bits = geometry.low_bits
+        bit0 = code & low_bits
+        bit1 = (code >> 1) & low_bits
+        bit2 = (code >> 2) & low_bits
+        up = bit0 & bit1 & ~bit2
+        down = bit2 & ~bit1 & ~bit0
+        left = bit2 & bit0 & ~bit1
+        right = bit2 & bit1 & ~bit0
+        head = bit0 & ~bit1 & ~bit2
+        body = bit0 & bit1 & bit2
+        below = 3 * width
+        # every '^' has a 'v' below it and every '<' a '>' to its right, and the
+        # goal piece's head has its three other cells to the right and below
+        if up << below == down and left << 3 == right and not left & geometry.right_edge \
+                and head and not head & geometry.right_edge \
+                and body == head << 3 | head << below | head << (below + 3):
+            return code, geometry
+    # describe what is wrong
+    board = read_from_lines(rows, goal)
+    return encode_board(board), board.geometry
+
+
+def split_puzzles(lines):
+    """
+    Split the lines of a file holding many puzzles into boards. Boards are
+    separated by blank lines, or given on a line of their own with their rows
+    separated by '/'. Lines starting with '#' are skipped.
+
+    :param lines: The lines of the file.
+    :type lines: Iterable[str]
+    :return: Pairs of (line number of the first row, rows of the puzzle).
+    :rtype: Iterator[Tuple[int, List[str]]]
+    """
+    rows = []
+    first_line = 0
+    for line_number, line in enumerate(lines, 1):
+        if line.startswith('#'):
+            continue
+        row = _puzzle_row(line)
+        if '/' in row:
+            if rows:
+                yield first_line, rows
+                rows = []
+            yield line_number, [_puzzle_row(part) for part in row.split('/')]
+        elif row:
+            if not rows:
+                first_line = line_number
+            rows.append(row)
+        elif rows:
+            yield first_line, rows
+            rows = []
+    if rows:
+        yield first_line, rows
+
+
+def read_boards(source, goal=None):
+    """
+    Read every puzzle of a file holding many puzzles.
+
+    :param source: The name of the file, or an open text stream.
+    :type source: Union[str, TextIO]
+    :param goal: The (row, col) the top-left cell of the 2x2 piece has to
+        reach, or None for the middle of the two bottom rows.
+    :type goal: Optional[Tuple[int, int]]
+    :return: The encoded boards and their geometries, in file order.
+    :rtype: List[Tuple[int, Geometry]]
+    :raises InvalidBoard: For the first invalid board, with the line number
+        of its first row.
+    """
+    stream = open(source, 'r') if isinstance(source, str) else source
+    boards = []
+    try:
+        for line_number, rows in split_puzzles(stream):
+            try:
+                boards.append(encode_rows(rows, goal))
+            except InvalidBoard as error:
+                raise InvalidBoard('board at line {}: {}'.format(line_number, error)) from None
+    finally:
+        if stream is not source:
+            stream.close()
+    return boards
+
+
+# ====================================================================================
+# Batch solving.
+#
+# Many puzzles are solved in one process and every result is written as one JSON
+# line as soon as it is known. Puzzles come from a directory or a glob of puzzle
+# files, or from JSON lines of the form {"id": ..., "board": ...} where the board
+# is either a string with one row per line or a list of rows.
+
+
+def iter_puzzles(source):
+    """
+    :param source: '-' for JSON lines on stdin, a .jsonl file, a directory of
+        puzzle files or a glob pattern matching puzzle files. A puzzle file
+        may hold several puzzles, as read by split_puzzles; they are then
+        named by the file and the line of their first row.
+    :type source: str
+    :return: Pairs of (puzzle id, rows of the puzzle). For a JSON line that
+        is not a puzzle record, the rows are the InvalidBoard to report.
+    :rtype: Iterator[Tuple[str, Union[List[str], InvalidBoard]]]
+    """
+    if source == '-' or source.endswith('.jsonl'):
+        stream = sys.stdin if source == '-' else open(source, 'r')
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                yield str(line_number), InvalidBoard('line {}: not valid JSON: {}'.format(
+                    line_number, error))
+                continue
+            if not isinstance(record, dict):
+                yield str(line_number), InvalidBoard('line {}: not a JSON object'.format(
+                    line_number))
+                continue
+            puzzle_id = str(record.get('id', line_number))
+            rows = record.get('board')
+            if isinstance(rows, str):
+                rows = rows.splitlines()
+            if not isinstance(rows, list) or not all(isinstance(row, str) for row in rows):
+                yield puzzle_id, InvalidBoard(
+                    'line {}: "board" must be a string or a list of rows'.format(line_number))
+                continue
+            yield puzzle_id, rows
+        if stream is not sys.stdin:
+            stream.close()
+        return
+    if os.path.isdir(source):
+        filenames = sorted(os.path.join(source, name) for name in os.listdir(source)
+                           if os.path.isfile(os.path.join(source, name)))
+    else:
+        filenames = sorted(glob.glob(source))
+    for filename in filenames:
+        with open(filename, 'r') as puzzle_file:
+            puzzles = list(split_puzzles(puzzle_file))
+        if len(puzzles) == 1:
+            yield filename, puzzles[0][1]
+        else:
+            for line_number, rows in puzzles:
+                yield '{}:{}'.format(filename, line_number), rows
+
+
+def board_rows(board):
+    """
+    :param board: The board to format.
+    :type board: Board
+    :return: The rows of the board as strings.
+    :rtype: List[str]
+    """
+    return [''.join(line) for line in board.grid]
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when its batch time limit runs out.
+    """
+
+
+def _raise_timeout(signum, frame):
+    raise SearchTimeout()
+
+
+@contextmanager
+def time_limit(seconds):
+    """
+    Raise SearchTimeout inside the with block once seconds have passed.
+
+    :param seconds: The limit in seconds, or None for no limit.
+    :type seconds: Optional[float]
+    """
+    if not seconds:
+        yield
+        return
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def solve_record(puzzle_id, board, options, database=None, timeout=None, cache=None,
+                 path_format='grid'):
+    """
+    Solve one batch puzzle and describe the outcome as a JSON-ready dict.
+
+    :param puzzle_id: The id reported with the result.
+    :type puzzle_id: str
+    :param board: The board to solve.
+    :type board: Board
+    :param options: Keyword arguments for solve, such as algo and heuristic.
+    :type options: Dict[str, Any]
+    :param database: The distance database used by lookup.
+    :type database: Optional[DistanceDatabase]
+    :param timeout: Seconds after which the search is abandoned, or None.
+    :type timeout: Optional[float]
+    :param cache: The solution cache used by solve, or None.
+    :type cache: Optional[SolutionCache]
+    :param path_format: How the path of a solved board is recorded: 'grid'
+        as the rows of every board, 'moves' as format_move strings, 'json' as
+        [piece, row, col, direction, distance] lists.
+    :type path_format: str
+    :return: The result record.
+    :rtype: Dict[str, Any]
+    """
+    record = {'id': puzzle_id, 'algo': options.get('algo', 'astar')}
+    start = time.perf_counter()
+    try:
+        with time_limit(timeout):
+            solution = solve(board, database=database, cache=cache, **options)
+    except SearchTimeout:
+        record['error'] = 'timed out after {} s'.format(timeout)
+    except MemoryError:
+        record['error'] = 'out of memory'
+    except (ValueError, IndexError) as error:
+        record['error'] = str(error)
+    else:
+        record['solved'] = solution.solved
+        record['status'] = solution.status
+        if 'reason' in solution.stats:
+            record['error'] = solution.stats['reason']
+        if 'cached' in solution.stats:
+            record['cached'] = True
+        if solution.solved:
+            record['moves'] = solution.length
+            if path_format == 'moves':
+                record['path'] = [format_move(move) for move in solution.moves]
+            elif path_format == 'json':
+                record['path'] = [list(move) for move in solution.moves]
+            else:
+                record['path'] = [code_rows(code, solution.geometry) for code in solution.path]
+    record['time'] = round(time.perf_counter() - start, 6)
+    return record
+
+
+# Distance databases and solution caches opened by this worker process, by filename.
+_worker_databases = {}
+_worker_caches = {}
+
+
+def _init_worker(memory_limit):
+    """
+    Pool initializer: cap the address space of the worker process.
+
+    :param memory_limit: The cap in bytes, or None.
+    :type memory_limit: Optional[int]
+    """
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _solve_task(task):
+    """
+    Solve one puzzle in a pool worker. The board arrives encoded.
+
+    :param task: (index, puzzle id, encoded board or None, key of its geometry,
+        parse error or None, solve options, database filename, timeout, cache
+        filename, path format).
+    :type task: Tuple
+    :return: The index of the puzzle and its result record.
+    :rtype: Tuple[int, Dict[str, Any]]
+    """
+    index, puzzle_id, code, geometry_key, error, options, db, timeout, cache_file, path_format = task
+    if error is not None:
+        return index, {'id': puzzle_id, 'algo': options.get('algo', 'astar'), 'error': error}
+    database = None
+    if db:
+        if db not in _worker_databases:
+            _worker_databases[db] = DistanceDatabase(db)
+        database = _worker_databases[db]
+    cache = None
+    if cache_file:
+        if cache_file not in _worker_caches:
+            _worker_caches[cache_file] = SolutionCache(filename=cache_file)
+        cache = _worker_caches[cache_file]
+    board = decode_board(code, get_geometry(*geometry_key))
+    return index, solve_record(puzzle_id, board, options, database, timeout, cache, path_format)
+
+
+def _worker_pool(workers, memory_limit):
+    """
+    :param workers: The number of worker processes.
+    :type workers: int
+    :param memory_limit: Address space cap of each worker in bytes, or None.
+    :type memory_limit: Optional[int]
+    :return: A fresh pool of workers running _solve_task.
+    :rtype: ProcessPoolExecutor
+    """
+    return ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(memory_limit,))
+
+
+def _pool_result(future, task):
+    """
+    :param future: A finished _solve_task of a worker pool.
+    :type future: concurrent.futures.Future
+    :param task: The task it ran.
+    :type task: Tuple
+    :return: The index of the puzzle and its result record, with an error if
+        the result could not be sent back.
+    :rtype: Tuple[int, Dict[str, Any]]
+    :raises BrokenProcessPool: If a worker of the pool died.
+    """
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        raise
+    except Exception as error:
+        index, puzzle_id, options = task[0], task[1], task[5]
+        return index, {'id': puzzle_id, 'algo': options.get('algo', 'astar'),
+                       'error': 'the worker failed: {!r}'.format(error)}
+
+
+def _solve_alone(task, memory_limit):
+    """
+    Solve one puzzle in a worker process of its own, so that if the worker
+    dies, the puzzle it was solving is known.
+
+    :param task: A task of _solve_task.
+    :type task: Tuple
+    :param memory_limit: Address space cap of the worker in bytes, or None.
+    :type memory_limit: Optional[int]
+    :return: The index of the puzzle and its result record.
+    :rtype: Tuple[int, Dict[str, Any]]
+    """
+    with _worker_pool(1, memory_limit) as pool:
+        try:
+            return _pool_result(pool.submit(_solve_task, task), task)
+        except BrokenProcessPool:
+            index, puzzle_id, options = task[0], task[1], task[5]
+            return index, {'id': puzzle_id, 'algo': options.get('algo', 'astar'),
+                           'error': 'the worker process died'}
+
+
+def batch_solve(puzzles, out, options, db=None, workers=1, timeout=None, memory_limit=None,
+                ordered=True, cache=None, goal=None, path_format='grid'):
+    """
+    Solve many puzzles, writing one JSON line per puzzle to out as soon as it
+    is solved. With more than one worker, or a memory limit, the puzzles are
+    spread over a process pool and sent to the workers as encoded boards. If
+    a worker dies, the puzzles the pool was solving are run again one by one
+    in workers of their own, and the one that kills its worker gets an error
+    record.
+
+    :param puzzles: Pairs of (puzzle id, rows of the puzzle).
+    :type puzzles: Iterable[Tuple[str, List[str]]]
+    :param out: The stream the results are written to.
+    :type out: TextIO
+    :param options: Keyword arguments for solve, such as algo and heuristic.
+        They are sent to the workers, so the heuristic must be given by name.
+    :type options: Dict[str, Any]
+    :param db: The distance database file used by lookup.
+    :type db: Optional[str]
+    :param workers: The number of worker processes.
+    :type workers: int
+    :param timeout: Seconds after which a puzzle is abandoned, or None.
+    :type timeout: Optional[float]
+    :param memory_limit: Address space cap of each worker in bytes, or None.
+    :type memory_limit: Optional[int]
+    :param ordered: Write results in input order rather than as they finish.
+    :type ordered: bool
+    :param cache: The SQLite file of a solution cache shared by the workers, or
+        None.
+    :type cache: Optional[str]
+    :param goal: The (row, col) the top-left cell of the 2x2 piece has to
+        reach on every board, or None for the middle of the two bottom rows.
+    :type goal: Optional[Tuple[int, int]]
+    :param path_format: How paths are recorded, as for solve_record.
+    :type path_format: str
+    """
+    def tasks():
+        for index, (puzzle_id, rows) in enumerate(puzzles):
+            try:
+                if isinstance(rows, InvalidBoard):
+                    raise rows
+                code, geometry = encode_rows(rows, goal)
+                geometry_key, error = geometry.key, None
+            except (ValueError, IndexError) as read_error:
+                code, geometry_key, error = None, None, str(read_error)
+            yield (index, puzzle_id, code, geometry_key, error, options, db, timeout, cache,
+                   path_format)
+
+    # finished records waiting for the ones before them, when ordered
+    finished = {}
+    next_index = 0
+
+    def write(index, record):
+        nonlocal next_index
+        if not ordered:
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            return
+        finished[index] = record
+        while next_index in finished:
+            out.write(json.dumps(finished.pop(next_index)) + '\n')
+            next_index += 1
+        out.flush()
+
+    if workers <= 1 and not memory_limit:
+        try:
+            for index, record in map(_solve_task, tasks()):
+                write(index, record)
+        finally:
+            _close_worker_files()
+        return
+
+    workers = max(workers, 1)
+    pending = tasks()
+    # future -> task, at most two tasks per worker so that a broken pool loses few
+    running = {}
+    pool = _worker_pool(workers, memory_limit)
+    try:
+        while True:
+            for task in pending:
+                running[pool.submit(_solve_task, task)] = task
+                if len(running) >= 2 * workers:
+                    break
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            lost = []
+            for future in done:
+                task = running.pop(future)
+                try:
+                    write(*_pool_result(future, task))
+                except BrokenProcessPool:
+                    lost.append(task)
+            if lost:
+                # a worker died and took the pool with it: find out which task
+                # killed it by running the unfinished ones alone
+                for future, task in running.items():
+                    try:
+                        write(*_pool_result(future, task))
+                    except BrokenProcessPool:
+                        lost.append(task)
+                running.clear()
+                pool.shutdown()
+                for task in sorted(lost, key=lambda task: task[0]):
+                    write(*_solve_alone(task, memory_limit))
+                pool = _worker_pool(workers, memory_limit)
+    finally:
+        pool.shutdown(cancel_futures=True)
+        _close_worker_files()
+
+
+def _close_worker_files():
+    """
+    Close the distance databases and solution caches opened by _solve_task in
+    this process.
+    """
+    for database in _worker_databases.values():
+        database.close()
+    _worker_databases.clear()
+    for worker_cache in _worker_caches.values():
+        worker_cache.close()
+    _worker_caches.clear()
+
+
+# ====================================================================================
+# Benchmarks.
+#
+# Every algorithm solves every puzzle of a corpus in a fresh worker process, so that
+# the peak RSS of one run is not inflated by the runs before it. The results can be
+# saved as JSON and compared with a stored baseline to catch regressions.
+
+# The corpus shipped with the solver, from a one-move board to the hardest board of
+# the classic piece set.
+bench_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench', 'puzzles')
+
+# Metrics that only depend on the search, compared exactly with the baseline.
+bench_counts = ('length', 'expanded', 'generated', 'peak_visited')
+
+# Metrics that vary from run to run: (name, absolute slack) on top of the tolerance.
+bench_measures = (('time', 0.05), ('peak_rss_kb', 4096))
+
+
+def _bench_task(task):
+    """
+    Solve one benchmark puzzle in a fresh pool worker and measure it.
+
+    :param task: (puzzle id, rows of the puzzle, solve options, database filename,
+        timeout).
+    :type task: Tuple
+    :return: The benchmark record.
+    :rtype: Dict[str, Any]
+    """
+    puzzle_id, rows, options, db, timeout = task
+    record = {'id': puzzle_id, 'algo': options['algo']}
+    database = DistanceDatabase(db) if db else None
+    start = time.perf_counter()
+    try:
+        if isinstance(rows, InvalidBoard):
+            raise rows
+        with time_limit(timeout):
+            solution = solve(read_from_lines(rows), database=database, **options)
+    except SearchTimeout:
+        record['status'] = 'timeout'
+    except (ValueError, IndexError) as error:
+        record['status'] = 'error'
+        record['error'] = str(error)
+    else:
+        record['status'] = solution.status
+        record['length'] = solution.length
+        for name in ('expanded', 'generated', 'peak_visited'):
+            record[name] = solution.stats[name]
+    record['time'] = round(time.perf_counter() - start, 6)
+    # ru_maxrss is in kilobytes on Linux
+    record['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if database is not None:
+        database.close()
+    return record
+
+
+def run_benchmarks(puzzles, algos, options, db=None, timeout=None, out=None):
+    """
+    Solve every puzzle with every algorithm, one fresh process per run.
+
+    :param puzzles: Pairs of (puzzle id, rows of the puzzle).
+    :type puzzles: Iterable[Tuple[str, List[str]]]
+    :param algos: The algorithms to run.
+    :type algos: List[str]
+    :param options: Keyword arguments for solve other than algo. The heuristic
+        must be given by name.
+    :type options: Dict[str, Any]
+    :param db: The distance database file used by lookup.
+    :type db: Optional[str]
+    :param timeout: Seconds after which a run is abandoned, or None.
+    :type timeout: Optional[float]
+    :param out: A stream that gets one line per run as it finishes, or None.
+    :type out: Optional[TextIO]
+    :return: The benchmark records, by puzzle and then by algorithm.
+    :rtype: List[Dict[str, Any]]
+    """
+    tasks = [(puzzle_id, rows, dict(options, algo=algo), db, timeout)
+             for puzzle_id, rows in puzzles for algo in algos]
+    results = []
+    for task in tasks:
+        # a pool of its own per run, so that no run inherits the memory of another
+        start = time.perf_counter()
+        with ProcessPoolExecutor(1) as pool:
+            try:
+                record = pool.submit(_bench_task, task).result()
+            except BrokenProcessPool:
+                record = {'id': task[0], 'algo': task[2]['algo'], 'status': 'error',
+                          'error': 'the worker process died',
+                          'time': round(time.perf_counter() - start, 6), 'peak_rss_kb': None}
+        results.append(record)
+        if out is not None:
+            out.write('{id} {algo}: {status} length={length} time={time:.3f}s '
+                      'expanded={expanded} peak_rss_kb={peak_rss_kb}\n'.format(
+                          **dict({'length': None, 'expanded': None}, **record)))
+            out.flush()
+    return results
+
+
+def compare_benchmarks(results, baseline, tolerance=0.2):
+    """
+    Compare benchmark records with a baseline run of the same corpus.
+
+    :param results: The records of this run.
+    :type results: List[Dict[str, Any]]
+    :param baseline: The records of the baseline run.
+    :type baseline: List[Dict[str, Any]]
+    :param tolerance: The allowed relative growth of time and peak RSS.
+    :type tolerance: float
+    :return: One message per regression.
+    :rtype: List[str]
+    """
+    # puzzles are matched by file name, so the corpus may be given by another path
+    previous = {(os.path.basename(record['id']), record['algo']): record for record in baseline}
+    regressions = []
+    for record in results:
+        name = os.path.basename(record['id'])
+        old = previous.get((name, record['algo']))
+        if old is None:
+            continue
+        name = '{} {}'.format(name, record['algo'])
+        if record['status'] != old['status']:
+            regressions.append('{}: status {} -> {}'.format(name, old['status'], record['status']))
+            continue
+        for metric in bench_counts:
+            if record.get(metric) is not None and old.get(metric) is not None \
+                    and record[metric] > old[metric]:
+                regressions.append('{}: {} {} -> {}'.format(name, metric, old[metric], record[metric]))
+        for metric, slack in bench_measures:
+            if record.get(metric) is not None and old.get(metric) is not None \
+                    and record[metric] > old[metric] * (1 + tolerance) + slack:
+                regressions.append('{}: {} {} -> {}'.format(name, metric, old[metric], record[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "command",
+        nargs='?',
+        default='solve',
+        choices=['solve', 'batch', 'build-db', 'bench', 'check'],
+        help="Solve a puzzle (default), solve many puzzles, build the distance "
+             "database for a puzzle's pieces, run the benchmarks, or only check "
+             "that a puzzle is valid and not known to be unsolvable."
+    )
+    parser.add_argument(
+        "--inputfile",
+        type=str,
+        help="The input file that contains the puzzle. For batch and bench, a directory, "
+             "a glob pattern, a .jsonl file or - for JSON lines on stdin; "
+             "bench defaults to the bundled corpus."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        help="The output file that contains the solution. For batch, - writes to stdout. "
+             "For bench, the JSON results."
+    )
+    parser.add_argument(
+        "--algo",
+        type=str,
+        choices=algorithms,
+        action='append',
+        help="The searching algorithm. bench accepts it several times and runs "
+             "every algorithm by default."
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        default='grid',
+        choices=sorted(output_formats),
+        help="How solutions are written: every board as a grid (default), one "
+             "'piece row col direction distance' line per move, or JSON. For batch, "
+             "how the path of each result is recorded."
+    )
+    parser.add_argument(
+        "--heuristic",
+        type=str,
+        default='manhattan',
+        choices=sorted(heuristics),
+        help="The heuristic used by astar."
+    )
+    parser.add_argument(
+        "--metric",
+        type=str,
+        default='step',
+        choices=sorted(metrics),
+        help="Count moving a piece by one cell as a move (default), or any slide "
+             "of one piece, around corners included."
+    )
+    parser.add_argument(
+        "--goal",
+        type=str,
+        metavar='ROW,COL',
+        help="Where the top-left cell of the 2x2 piece has to go, counted from 0; "
+             "defaults to the middle of the two bottom rows."
+    )
+    parser.add_argument(
+        "--symmetry",
+        action='store_true',
+        help="Merge boards with their mirror images in the visited set."
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        help="The distance database written by build-db and read by lookup."
+    )
+    parser.add_argument(
+        "--pattern",
+        type=str,
+        metavar='KINDS',
+        help="Make build-db write a pattern database keeping the 2x2 piece and the "
+             "given comma-separated kinds of pieces: " + ', '.join(piece_kinds) + "."
+    )
+    parser.add_argument(
+        "--pattern-db",
+        type=str,
+        action='append',
+        help="A pattern database written by build-db --pattern; astar and idastar take "
+             "the largest of the heuristic and its distances. May be given several times."
+    )
+    parser.add_argument(
+        "--tie-break",
+        type=str,
+        default='deep',
+        choices=sorted(tie_breaks),
+        help="How astar orders boards with equal f: deepest first (default), "
+             "shallowest first or in insertion order."
+    )
+    parser.add_argument(
+        "--open-list",
+        type=str,
+        default='heap',
+        choices=sorted(open_lists),
+        help="The open list used by astar: a binary heap or integer f buckets."
+    )
+    parser.add_argument(
+        "--table-size",
+        type=int,
+        default=1 << 20,
+        help="The most boards idastar keeps in its transposition table."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="The number of worker processes used by batch."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Seconds after which batch or bench gives up on a puzzle "
+             "(bench defaults to 30)."
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=int,
+        help="Address space cap of each batch worker process, in MB."
+    )
+    parser.add_argument(
+        "--unordered",
+        action='store_true',
+        help="Write batch results as they finish instead of in input order."
+    )
+    parser.add_argument(
+        "--max-time",
+        type=float,
+        help="Stop the search after this many seconds."
+    )
+    parser.add_argument(
+        "--max-expanded",
+        type=int,
+        help="Stop the search after this many expanded boards."
+    )
+    parser.add_argument(
+        "--max-visited",
+        type=int,
+        help="Stop the search once it remembers this many boards."
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        help="An SQLite file caching optimal solutions across runs; boards solved "
+             "before, their mirror images and every board on their paths are "
+             "answered without searching."
+    )
+    parser.add_argument(
+        "--stats",
+        action='store_true',
+        help="Print search statistics and phase times to stderr while solving."
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        help="Benchmark results to compare against; regressions make bench exit with 1."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative growth of time and peak RSS that bench still accepts."
+    )
+    args = parser.parse_args()
+    if args.algo and 'lookup' in args.algo and args.db is None:
+        parser.error('lookup needs --db')
+    if args.algo and 'lookup' in args.algo and args.metric != 'step':
+        parser.error('lookup only knows the step metric')
+    kinds = args.pattern.split(',') if args.pattern else []
+    for kind in kinds:
+        if kind not in piece_kinds:
+            parser.error('unknown kind of piece {}, expected one of {}'.format(
+                kind, ', '.join(piece_kinds)))
+    goal = None
+    if args.goal is not None:
+        try:
+            goal = tuple(int(part) for part in args.goal.split(','))
+        except ValueError:
+            goal = ()
+        if len(goal) != 2:
+            parser.error('--goal takes a row and a column, such as 3,1')
+
+    if args.command == 'bench':
+        algos = args.algo or [algo for algo in algorithms if algo != 'lookup' or args.db]
+        options = {'heuristic': args.heuristic, 'symmetric': args.symmetry,
+                   'table_size': args.table_size, 'tie_break': args.tie_break,
+                   'open_list': args.open_list, 'max_time': args.max_time,
+                   'max_expanded': args.max_expanded, 'max_visited': args.max_visited,
+                   'metric': args.metric, 'patterns': args.pattern_db}
+        timeout = args.timeout if args.timeout is not None else 30
+        results = run_benchmarks(iter_puzzles(args.inputfile or bench_dir), algos, options,
+                                 args.db, timeout, sys.stdout)
+        if args.outputfile:
+            with open(args.outputfile, 'w') as output_file:
+                json.dump(results, output_file, indent=1)
+        if args.baseline:
+            with open(args.baseline, 'r') as baseline_file:
+                regressions = compare_benchmarks(results, json.load(baseline_file),
+                                                 args.tolerance)
+            for regression in regressions:
+                print('regression: ' + regression)
+            sys.exit(1 if regressions else 0)
+        sys.exit()
+
+    if args.inputfile is None:
+        parser.error('--inputfile is required')
+    if args.algo and len(args.algo) > 1:
+        parser.error('--algo can only be given once')
+    options = {'algo': args.algo[0] if args.algo else None, 'heuristic': args.heuristic,
+               'symmetric': args.symmetry, 'table_size': args.table_size,
+               'tie_break': args.tie_break, 'open_list': args.open_list,
+               'max_time': args.max_time, 'max_expanded': args.max_expanded,
+               'max_visited': args.max_visited, 'metric': args.metric,
+               'patterns': args.pattern_db}
+
+    if args.command == 'batch':
+        if args.outputfile is None or args.algo is None:
+            parser.error('--outputfile and --algo are required to solve puzzles')
+        out = sys.stdout if args.outputfile == '-' else open(args.outputfile, 'w')
+        memory_limit = args.max_memory * 1024 * 1024 if args.max_memory else None
+        batch_solve(iter_puzzles(args.inputfile), out, options, args.db, args.workers,
+                    args.timeout, memory_limit, not args.unordered, args.cache, goal,
+                    args.format)
+        if out is not sys.stdout:
+            out.close()
+        sys.exit()
+
+    # read the board from the file
+    try:
+        board = read_from_file(args.inputfile, goal)
+    except InvalidBoard as error:
+        sys.exit('{}: invalid board: {}'.format(args.inputfile, error))
+    uses_db = args.command == 'build-db' or args.algo and 'lookup' in args.algo or args.pattern_db
+    if uses_db and board.geometry is not classic:
+        sys.exit('{}: distance databases only cover the classic 5x4 board'.format(args.inputfile))
+
+    if args.command == 'check':
+        database = DistanceDatabase(args.db) if args.db else None
+        reason = precheck(encode_board(board), database, board.geometry)
+        if reason is not None:
+            sys.exit('{}: unsolvable: {}'.format(args.inputfile, reason))
+        print('{}: ok'.format(args.inputfile))
+        sys.exit()
+
+    if args.command == 'build-db':
+        if args.db is None:
+            parser.error('build-db needs --db')
+        counts = piece_counts(encode_board(board))
+        if kinds:
+            write_distance_db(args.db, build_pattern_table(counts, kinds))
+        else:
+            write_distance_db(args.db, build_distance_table(counts))
+        sys.exit()
+
+    if args.outputfile is None or args.algo is None:
+        parser.error('--outputfile and --algo are required to solve a puzzle')
+    database = DistanceDatabase(args.db) if args.db else None
+    if 'lookup' in args.algo and database.counts != piece_counts(encode_board(board)):
+        sys.exit("{}: {}: database does not cover this board's pieces".format(
+            args.inputfile, args.db))
+
+    stats = None
+    if args.stats:
+        stats = SearchStats(lambda progress: sys.stderr.write(
+            format_stats(progress, progress.elapsed()) + '\n'), timers=True)
+    cache = SolutionCache(filename=args.cache) if args.cache else None
+    solution = solve(board, database=database, stats=stats, cache=cache, **options)
+    if cache is not None:
+        cache.close()
+    if stats is not None:
+        sys.stderr.write('{} moves={} {}\n'.format(
+            solution.status, solution.length, format_stats(stats, solution.stats['time'])))
+    if 'reason' in solution.stats:
+        sys.stderr.write('unsolvable: {}\n'.format(solution.stats['reason']))
+    if solution.best:
+        sys.stderr.write('stopped by the {}; the closest board reached, {} moves in:\n{}\n'.format(
+            solution.status, len(solution.best) - 1,
+            '\n'.join(board_rows(decode_board(solution.best[-1], solution.geometry)))))
+    with open(args.outputfile, 'w') as output_file:
+        write_solution(solution, output_file, args.format)